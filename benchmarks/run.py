@@ -0,0 +1,209 @@
+"""
+Times flaws phases on a synthetic package and a real-world corpus, writes results as JSON.
+
+Usage:
+
+    python -m benchmarks.run [--modules=N] [--depth=N] [--defs=N] [--repeat=N]
+                             [--statements=N] [--nesting=N]
+                             [--corpus=PATH,...] [--output=FILE] [--compare=FILE]
+
+Real-world corpus defaults to several packages of the running python stdlib.
+
+Also times command line startup, `flaws local` on a tiny file in a fresh interpreter.
+Exits with an error if that got more than STARTUP_TOLERANCE slower than in compared results.
+"""
+from __future__ import print_function
+import ast
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+from timeit import default_timer
+
+from flaws import __version__
+from flaws.analysis import FileSet, global_usage, local_usage
+from flaws.ext import django
+from flaws.patterns import Matcher, compile_template
+from flaws.scopes import TreeLinker, build_scopes
+from flaws.utils import slurp
+
+from .synthetic import generate, generate_huge
+
+
+STDLIB_PACKAGES = ['asyncio', 'email', 'http', 'importlib', 'json', 'logging', 'unittest', 'xml']
+
+PHASES = ['slurp', 'parse', 'link', 'scopes', 'local', 'summary', 'global', 'patterns', 'django']
+
+STARTUP_TOLERANCE = 0.2
+STARTUP_SCRIPT = "import sys; sys.argv = ['flaws', 'local', %r, '--no-cache']; " \
+                 "import flaws; flaws.main()"
+
+
+# Some templates to match
+
+@compile_template
+def useless_if(cond=ast.expr):
+    if cond:
+        return True
+    else:
+        return False
+
+@compile_template
+def len_compare(x=ast.expr):
+    len(x) == 0
+
+@compile_template
+def swap(a=ast.Name, b=ast.Name, t=ast.Name):
+    t = a
+    a = b
+    b = t
+
+TEMPLATES = {'useless_if': useless_if, 'len_compare': len_compare, 'swap': swap}
+
+
+def run_phases(roots, django_opts=None):
+    """
+    Runs all phases once on fresh files, returns {phase: seconds}.
+    """
+    files = FileSet(roots)
+    pyfiles = sorted(files.values(), key=lambda f: f.package)
+    timings = {}
+
+    def timed(phase, func):
+        start = default_timer()
+        result = func()
+        timings[phase] = default_timer() - start
+        return result
+
+    sources = timed('slurp', lambda: [slurp(f.filename) for f in pyfiles])
+    trees = timed('parse', lambda: [ast.parse(source, filename=f.filename)
+                                    for f, source in zip(pyfiles, sources)])
+    timed('link', lambda: [TreeLinker().visit(tree) for tree in trees])
+    timed('scopes', lambda: [build_scopes(tree) for tree in trees])
+    for pyfile, tree in zip(pyfiles, trees):
+        pyfile.tree = tree
+        pyfile.scope = tree.scope
+
+    timed('local', lambda: list(local_usage(files)))
+    timed('summary', files.summarize)
+    timed('global', lambda: list(global_usage(files)))
+
+    matcher = Matcher(TEMPLATES)
+    timed('patterns', lambda: [matcher.match(tree, tree.index) for tree in trees])
+    timed('django', lambda: django.global_usage(files, defaultdict(set), opts=django_opts or {}))
+
+    return timings
+
+
+def bench(name, roots, repeat, django_opts=None):
+    runs = [run_phases(roots, django_opts) for _ in range(repeat)]
+    files = FileSet(roots)
+    return {
+        'name': name,
+        'roots': roots,
+        'files': len(files),
+        'lines': sum(bytes(slurp(f.filename)).count(b'\n') for f in files.values()),
+        'phases': {phase: _stats([run[phase] for run in runs]) for phase in PHASES},
+    }
+
+
+def startup(path, repeat):
+    """
+    Times running `flaws local` on a tiny file in a fresh python process.
+    """
+    filename = os.path.join(path, 'tiny.py')
+    with open(filename, 'w') as f:
+        f.write('import os\n')
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        [os.path.dirname(os.path.dirname(os.path.abspath(__file__)))]
+        + ([os.environ['PYTHONPATH']] if os.environ.get('PYTHONPATH') else [])))
+
+    times = []
+    with open(os.devnull, 'w') as devnull:
+        for _ in range(repeat):
+            start = default_timer()
+            subprocess.check_call([sys.executable, '-c', STARTUP_SCRIPT % filename],
+                                  env=env, stdout=devnull)
+            times.append(default_timer() - start)
+    return _stats(times)
+
+
+def _stats(times):
+    times = sorted(times)
+    return {'min': times[0], 'median': times[len(times) // 2], 'runs': times}
+
+
+def compare(old, new):
+    """
+    Prints median phase timings of new results relative to old ones.
+    """
+    old_corpora = {c['name']: c for c in old['corpora']}
+    for corpus in new['corpora']:
+        if corpus['name'] not in old_corpora:
+            continue
+        print('%s (%s -> %s):' % (corpus['name'], old['flaws'], new['flaws']))
+        for phase in PHASES:
+            before = old_corpora[corpus['name']]['phases'][phase]['median']
+            after = corpus['phases'][phase]['median']
+            print('  %-10s %8.3fs %8.3fs %+7.1f%%'
+                  % (phase, before, after, (after / before - 1) * 100 if before else 0))
+
+    if 'startup' in old:
+        before, after = old['startup']['min'], new['startup']['min']
+        print('startup:     %8.3fs %8.3fs %+7.1f%%' % (before, after, (after / before - 1) * 100))
+        return after <= before * (1 + STARTUP_TOLERANCE)
+    return True
+
+
+def main():
+    opts = dict(arg[2:].partition('=')[::2] for arg in sys.argv[1:] if arg.startswith('--'))
+    repeat = int(opts.get('repeat') or 3)
+
+    if opts.get('corpus'):
+        corpus = opts['corpus'].split(',')
+    else:
+        stdlib = os.path.dirname(os.__file__)
+        corpus = [os.path.join(stdlib, p) for p in STDLIB_PACKAGES
+                  if os.path.isdir(os.path.join(stdlib, p))]
+
+    results = {
+        'flaws': __version__,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'corpora': [],
+    }
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        results['startup'] = startup(tmpdir, repeat * 5)
+        synth = generate(tmpdir, modules=int(opts.get('modules') or 300),
+                         depth=int(opts.get('depth') or 3), defs=int(opts.get('defs') or 10))
+        results['corpora'].append(bench('synthetic', [synth], repeat,
+                                        {'settings': 'synth.settings'}))
+        huge = generate_huge(tmpdir, statements=int(opts.get('statements') or 20000),
+                             depth=int(opts.get('nesting') or 90))
+        results['corpora'].append(bench('generated', [huge], repeat))
+    finally:
+        shutil.rmtree(tmpdir)
+    results['corpora'].append(bench('real', corpus, repeat))
+
+    output = json.dumps(results, indent=4, sort_keys=True)
+    if opts.get('output'):
+        with open(opts['output'], 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if opts.get('compare'):
+        with open(opts['compare']) as f:
+            if not compare(json.load(f), results):
+                sys.exit('Startup time regressed')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""
+Generates synthetic packages to benchmark flaws on.
+
+Package is a tree of subpackages of given depth with modules spread over it.
+Modules import from each other, use star imports, define functions and classes
+with some unused names here and there, plus a django-like settings, urls and views.
+
+Also generates a package of machine-generated looking modules: a very long one,
+deeply nested ones and a large class.
+"""
+import os
+import random
+
+
+MODULE = '''\
+import os
+import sys
+from %(abs_import)s import func_0
+from .%(sibling)s import *
+
+__all__ = [%(exports)s]
+
+CONST = %(const)r
+
+
+'''
+
+FUNC = '''\
+def func_%(i)d(a, b=1, *args, **kwargs):
+    x = a + b
+    unused_%(i)d = os.path.join('a', 'b')
+    for item in args:
+        x += len(item)
+    if x < 12:
+        return True
+    else:
+        return False
+
+
+'''
+
+CLASS = '''\
+class Class_%(i)d(object):
+    attr = func_0
+
+    def __init__(self, value):
+        self.value = value
+
+    def method(self, other):
+        return [v for v in other if v != self.value and func_%(i)d(v)]
+
+
+'''
+
+SETTINGS = '''\
+DEBUG = True
+ROOT_URLCONF = 'synth.urls'
+INSTALLED_APPS = ['synth']
+MIDDLEWARE_CLASSES = [%s]
+'''
+
+
+def generate(path, modules=100, depth=3, defs=10, seed=0):
+    """
+    Writes synth package with given number of modules under path, returns package dir.
+    """
+    rand = random.Random(seed)
+    root = os.path.join(path, 'synth')
+
+    # Build package tree
+    packages = [('synth', root)]
+    for level in range(depth):
+        for name, dirname in list(packages):
+            if name.count('.') == level:
+                for i in range(2):
+                    packages.append(('%s.sub%d' % (name, i), os.path.join(dirname, 'sub%d' % i)))
+    for _, dirname in packages:
+        _write(os.path.join(dirname, '__init__.py'), '')
+
+    # Spread modules over packages, module 0 in each one is what the others import
+    names = []
+    for n in range(modules):
+        package, dirname = packages[n % len(packages)]
+        i = n // len(packages)
+        names.append(('%s.mod%d' % (package, i), os.path.join(dirname, 'mod%d.py' % i), i))
+    for package, _ in packages:
+        if '%s.mod0' % package not in {name for name, _, _ in names}:
+            names.append(('%s.mod0' % package, os.path.join(_dir(packages, package), 'mod0.py'), 0))
+
+    for name, filename, i in names:
+        source = MODULE % {
+            'abs_import': rand.choice(names)[0] if i else 'synth.views',
+            'sibling': 'mod0' if i else 'views_helpers',
+            'exports': ', '.join("'func_%d'" % k for k in range(0, defs, 2)),
+            'const': '%s.func_%d' % (rand.choice(names)[0], rand.randrange(defs)),
+        }
+        source += ''.join((CLASS if k % 3 == 2 else FUNC) % {'i': k} for k in range(defs))
+        _write(filename, source)
+
+    # Django-like parts
+    views = ['view_%d' % k for k in range(max(1, modules // 10))]
+    _write(os.path.join(root, 'views_helpers.py'), "__all__ = []\n")
+    _write(os.path.join(root, 'views.py'), ''.join(
+        'def %s(request):\n    return request\n\n\n' % view for view in views
+    ) + 'def func_0():\n    pass\n')
+    _write(os.path.join(root, 'urls.py'),
+           'from django.conf.urls import url\n\nurlpatterns = [\n%s]\n'
+           % ''.join("    url(r'^%s/$', 'synth.views.%s'),\n" % (view, view) for view in views))
+    _write(os.path.join(root, 'settings.py'),
+           SETTINGS % ', '.join("'%s.Class_2'" % name for name, _, _ in names[:5]))
+
+    return root
+
+
+def generate_huge(path, statements=20000, depth=90, terms=1000, siblings=20):
+    """
+    Writes gen package with a module of given number of statements, a module nested
+    to given depth, nested closures with siblings at each level and a large class,
+    returns package dir.
+    """
+    root = os.path.join(path, 'gen')
+    _write(os.path.join(root, '__init__.py'), '')
+
+    # Long flat module, like generated tables or protobufs
+    lines = ['import os\n']
+    for k in range(statements):
+        if k % 3 == 0:
+            lines.append('VALUE_%d = os.path.join(%r, %r)\n' % (k, 'a', str(k)))
+        elif k % 3 == 1:
+            lines.append('CHECK_%d = len(VALUE_%d) == 0\n' % (k, k - 1))
+        else:
+            lines.append('def func_%d(x, y=VALUE_%d):\n    return x + y\n' % (k, k - 2))
+    _write(os.path.join(root, 'long.py'), ''.join(lines))
+
+    # Deeply nested functions, blocks and a long expression in the middle
+    lines = []
+    for level in range(depth):
+        indent = '    ' * level
+        if level % 2:
+            lines.append('%sif x%d:\n' % (indent, level - 1))
+        else:
+            lines.append('%sdef f%d(x%d):\n' % (indent, level, level))
+    indent = '    ' * depth
+    lines.append('%sresult = %s\n' % (indent, ' + '.join('x%d' % (k % depth - k % 2)
+                                                          for k in range(terms))))
+    lines.append('%sreturn result\n' % indent)
+    _write(os.path.join(root, 'deep.py'), ''.join(lines))
+
+    # Nested closures, each level with several sibling lambdas and comprehensions
+    # referring to names of outer levels
+    lines = []
+    for level in range(depth):
+        indent = '    ' * level
+        lines.append('%sdef f%d(x%d):\n' % (indent, level, level))
+        for k in range(siblings):
+            outer = 'x%d' % (k * 7 % (level + 1))
+            if k % 2:
+                lines.append('%s    l%d = lambda y: y + %s + free%d\n' % (indent, k, outer, k))
+            else:
+                lines.append('%s    c%d = [y for y in %s if free%d]\n' % (indent, k, outer, k))
+    lines.append('%sreturn x0\n' % ('    ' * depth))
+    _write(os.path.join(root, 'closures.py'), ''.join(lines))
+
+    # Large class body, its names used in defaults, module ones in methods
+    lines = ['import os\n', 'class Large(object):\n']
+    for k in range(statements // 10):
+        lines.append('    attr_%d = os\n' % k)
+        lines.append('    def method_%d(self, x=attr_%d):\n' % (k, k))
+        lines.append('        return [self.attr_%d for _ in x if os]\n' % k)
+    _write(os.path.join(root, 'classes.py'), ''.join(lines))
+
+    return root
+
+
+def _dir(packages, package):
+    return dict(packages)[package]
+
+def _write(filename, source):
+    dirname = os.path.dirname(filename)
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    with open(filename, 'w') as f:
+        f.write(source)
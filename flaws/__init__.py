@@ -1,14 +1,23 @@
 #!/usr/bin/env python
-import sys
+__version__ = '0.0.1'
 
-from funcy import split, map
+import sys
 
-from .analysis import global_usage, local_usage, FileSet
 
+# NOTE: imports are done inside main() and only as needed, so that importing flaws,
+#       e.g. flaws.patterns, stays cheap and command line starts fast.
 
 def main():
+    from funcy import map, partial
+    from funcy.py3 import lsplit
+
+    from .analysis import global_usage, local_usage, FileSet
+    from .diagnostics import SINKS
+    from .ext import load_plugins
+    from .profiling import profiler
+
     command = sys.argv[1]
-    opts, args = split(r'^--', sys.argv[2:])
+    opts, args = lsplit(r'^--', sys.argv[2:])
     opts = dict(map(r'^--([\w-]+)(?:=(.+))?', opts))
 
     # Run ipdb on exception
@@ -29,23 +38,106 @@ def main():
 
         sys.excepthook = info
 
-    # Register plugins
-    from .ext import django
-    django.register(args, opts)
+    # Register plugins, these are only needed for global analysis
+    if command in GLOBAL_COMMANDS:
+        plugins = opts['plugins'] if 'plugins' in opts else 'django'
+        load_plugins(plugins.split(',') if plugins else [], args, opts)
 
     # Do the job
-    files = FileSet(args, base=opts.get('base'), ignore=opts.get('ignore'),
-        entry_points=opts.get('entry-points'))
-    if command == 'global':
-        global_usage(files)
+    cache_dir = None if 'no-cache' in opts else opts.get('cache-dir') or '.flaws_cache'
+    file_opts = dict(base=opts.get('base'), ignore=opts.get('ignore'),
+        entry_points=opts.get('entry-points'), cache_dir=cache_dir,
+        low_memory='low-memory' in opts, gitignore='gitignore' in opts,
+        exclude=opts['exclude'].split(',') if opts.get('exclude') else None)
+    make_files = partial(FileSet, args, **file_opts)
+    output_format = opts.get('format') or 'text'
+    if output_format not in SINKS:
+        sys.exit('Unknown format %s, choose from %s' % (output_format, ', '.join(sorted(SINKS))))
+    sink = SINKS[output_format]
+    if command == 'serve':
+        from .server import serve
+        serve(args, partial(FileSet, **file_opts))
+        return
+    if command == 'watch':
+        from .watch import Watcher
+        Watcher(args, make_files, sink=sink).run()
+        return
+
+    if 'profile' in opts:
+        profiler.enable()
+    if command == 'merge':
+        from .shards import load_shards
+        try:
+            files = load_shards(args)
+        except (ValueError, EnvironmentError) as e:
+            sys.exit(str(e))
+    else:
+        files = make_files()
+    jobs = int(opts['jobs'] or _cpu_count()) if 'jobs' in opts else None
+    if command == 'index':
+        from .symbols import write_symbols
+        write_symbols(files, opts.get('output') or 'flaws.db', jobs=jobs)
+        return
+    elif command == 'global' and opts.get('shard'):
+        from .shards import parse_shard, select_shard, write_shard
+        try:
+            shard = parse_shard(opts['shard'])
+        except ValueError as e:
+            sys.exit(str(e))
+        select_shard(files, *shard)
+        write_shard(files, shard, opts.get('output') or 'flaws-%d-of-%d.shard' % shard, jobs=jobs)
+        return
+    elif command in ('global', 'merge'):
+        diagnostics = global_usage(files, jobs=jobs)
     elif command == 'local':
-        local_usage(files)
+        diagnostics = local_usage(files, jobs=jobs)
     elif command == 'scope':
-        assert len(files) == 1
-        (filename, file), = files.items()
-        print(file.scope)
+        if opts.get('module'):
+            if opts['module'] not in files:
+                print('Unknown module %s' % opts['module'])
+                return
+            print(files.scope_of(opts['module']))
+            return
+        for package, pyfile in sorted(files.items()):
+            if len(files) > 1:
+                print('# %s' % pyfile.filename)
+            print(pyfile.scope)
+        return
+    elif command == 'uses':
+        if not opts.get('ref'):
+            print('Specify a name to look for with --ref=module.name')
+            return
+        module, name = files.modules.split_ref(opts['ref'])
+        if module is None:
+            print('Unknown module in %s' % opts['ref'])
+            return
+        for package, node in files.find_uses(module, name):
+            print('%s:%d:%d' % (files[package].filename, node.lineno, node.col_offset))
+        return
     else:
         print('Unknown command', command)
+        return
+
+    if 'profile' in opts:
+        # Diagnostics are made lazily, so these are collected first
+        # not to account analysis to output
+        with profiler.phase('analysis'):
+            diagnostics = list(diagnostics)
+    with profiler.phase('output'):
+        sink(diagnostics)
+
+    if 'profile' in opts:
+        if jobs and jobs > 1:
+            sys.stderr.write('NOTE: per file phases run in worker processes are not profiled\n')
+        profiler.report(top=int(opts['profile'] or 10))
+
+
+GLOBAL_COMMANDS = {'global', 'merge', 'index', 'watch', 'serve'}
+
+
+def _cpu_count():
+    from multiprocessing import cpu_count
+    return cpu_count()
 
 
 if __name__ == '__main__':
@@ -1,208 +1,421 @@
 from __future__ import absolute_import
 import ast
+import hashlib
 import os
 import re
 from collections import defaultdict
+from itertools import count
 
-from funcy.py2 import cached_property, ikeep, any, all, remove
-from tqdm import tqdm
+from funcy.py2 import cached_property, all, collecting
 
 from .asttools import is_write, is_use, is_param, is_import, name_class
-from .utils import slurp
-from .scopes import fill_scopes
+from .utils import slurp, progress, BulkGC
+from .scopes import TreeLinker, build_scopes
+from .summary import Summary
+from .modules import ModuleTable
+from .query import find_uses
+from .cache import Cache
+from .diagnostics import Diagnostic
+from .ignore import Ignore, git_files
+from .profiling import profiler
 from .ext import run_global_usage
 
 
 IGNORED_VARS = {'__all__', '__file__', '__name__', '__version__', '__author__'}
 
 
-def global_usage(files):
+def global_usage(files, jobs=None):
+    with profiler.phase('cache'):
+        index = UsageIndex.load(files)
+    with profiler.phase('summarize'):
+        files.summarize(jobs)
+    with profiler.phase('global'):
+        index.update(files)
+    with profiler.phase('cache'):
+        index.save(files)
+
+    for diag in index.plugin_errors:
+        yield diag
+    for package in sorted(files):
+        for diag in index.warnings[package]:
+            yield diag
+    for package in sorted(files):
+        for diag in index.verdicts[package]:
+            yield diag
+
+
+def file_usage(pyfile, files):
+    """
+    Finds names a file uses globally.
+    Returns {module: names} dict, star imported modules and warnings.
+    """
     used = defaultdict(set)
+    stars = set()
+    warnings = []
     # TODO: detect undefined names in a scope with star imports
     # # This is used to detect undefined names
     # starimports = defaultdict(set)
     # starimports[package].update(exports)
 
-    # print files['cacheops'].scope
-
-    # used[module][name] = [(mod1, node1), (mod2, node2), ...]
-    # used[module, name] = [(mod1, node1), (mod2, node2), ...]
-    # used[module][name] = (mod1, node1)
-    # used[module, name] = (mod1, node1)
-
-    # for package, pyfile in sorted(files.items()):
-    for package, pyfile in tqdm(sorted(files.items()), leave=False):
-        for scope in pyfile.scope.walk_scopes():
-            for node in scope.imports:
-                if isinstance(node, ast.ImportFrom):
-                    module = get_import_module(node, pyfile, files)
-
-                    # Mark all imported things as used
-                    if module in files:
-                        names = {alias.name for alias in node.names}
-                        used[module].update(names)
-
-                        # Handle star imports
-                        if '*' in names:
-                            exports = files[module].scope.exports
-                            if exports is None:
-                                print('%s:%d: star import with no __all__ in %s' % \
-                                      (pyfile.filename, node.lineno, module))
-                                exports = files[module].scope.implicit_exports
-
-                            if pyfile.is_entry:
-                                if pyfile.scope.exports:
-                                    used[module].update(set(exports) & set(pyfile.scope.exports))
-                                else:
-                                    used[module].update(exports)
-                            else:
-                                used[module].update(
-                                    name for name in exports
-                                         if any(is_use, scope.maybe_from_star.get(name, ())))
-
-                    # When importing module look for `module.name`
-                    # TODO: support `from mod1 import mod2; mod2.mod3.func()`
-                    for alias in node.names:
-                        full_name = '%s.%s' % (module, alias.name)
-                        if full_name in files:
-                            nodes = scope.names[alias.asname or alias.name]
-                            used[full_name].update(
-                                n.up.attr for n in nodes if isinstance(n.up, ast.Attribute))
-
-                elif isinstance(node, ast.Import):
-                    # TODO: support `import mod1; mod1.mod2.func()`
-                    # TODO: handle non-future relative imports
-                    for alias in node.names:
-                        if alias.name in files:
-                            nodes = scope.names[(alias.asname or alias.name).split('.')[0]]
-                            attrs = ikeep(find_attr(alias.asname or alias.name, node)
-                                          for node in nodes[1:])
-                            used[alias.name].update(attrs)
-
-        # Direct usage
-        for name, nodes in pyfile.scope.names.items():
-            if any(is_use, nodes):
-                used[package].add(name)
-
-        # Entry point usage
-        if pyfile.is_entry:
-            # TODO: warn about no __all__ in entry point?
-            exports = pyfile.scope.exports or pyfile.scope.implicit_exports
-            used[package].update(exports)
-
-    run_global_usage(files, used)
-
-    for package, pyfile in sorted(files.items()):
-        for name, nodes in pyfile.scope.names.items():
-            if name not in used[package] and name not in IGNORED_VARS:
-                print('%s:%d: %s %s is never used (globally)' % \
-                      (pyfile.filename, nodes[0].lineno, name_class(nodes[0]), name))
-
-
-def find_attr(expr, node):
-    parts = expr.split('.')[1:]
-    i = 0
-    while len(parts) > i and is_attr(node.up, parts[i]):
-        node = node.up
-
-    if isinstance(node.up, ast.Attribute):
-        return node.up.attr
-
-def is_attr(node, attr):
-    return isinstance(node, ast.Attribute) and node.attr == attr
-
-
-def get_import_module(node, pyfile, files):
-    def _rel_import(module, level):
-        subs = pyfile.dotname.split('.')[:-level]
-        if module:
-            subs.append(module)
-        return '.'.join(subs)
-
-    if not node.level:
-        # Try relative import first
-        # TODO: in python 3 it's always future
-        if 'absolute_import' not in pyfile.scope.future:
-            imported = _rel_import(node.module, 1)
-            if imported in files:
-                return imported
-        return node.module
-    else:
-        return _rel_import(node.module, node.level)
-
-
-def local_usage(files):
-    for _, pyfile in sorted(files.items()):
-        for scope, name, nodes in pyfile.scope.walk():
-            node = nodes[0]
-            if all(is_use, nodes) and not scope.is_global(name) and not scope.sees_stars:
-                print('%s:%d:%d: undefined variable %s' \
-                      % (pyfile.filename, node.lineno, node.col_offset, name))
-            if not scope.is_class and all(is_write, nodes):
-                if name == '_' or scope.is_module and re.search(r'^__\w+__$', name):
-                    continue
-                elif scope.exports is not None and name in scope.exports:
-                    continue
-                elif scope.exports is None and not name.startswith('_') and not is_import(node):
-                    continue
-                # NOTE: skipping all params for now as this gets too many false positives:
-                #       protocols, overriden methods, signal handlers, etc.
-                elif is_param(node):
-                    continue
-                # # TODO: check that it is method/classmethod
-                # elif is_param(node) and name in {'self', 'cls', 'kwargs', 'request'}:
-                #     continue
-                # BUG: shows unused import when it's meant for reexport
-                print('%s:%d:%d: %s %s is never used' % \
-                      (pyfile.filename, node.lineno, node.col_offset, name_class(node), name))
+    summary = pyfile.summary
+    warnings.extend(Diagnostic(pyfile.filename, *error) for error in summary.errors)
+    if summary.bad_exports:
+        warnings.append(Diagnostic(pyfile.filename, summary.bad_exports, None, 'bad-all',
+                                   'failed parsing __all__'))
+
+    for lineno, module, names, star_uses, uses in files.modules.imports(pyfile):
+        # Mark all from imported things as used
+        if module in files:
+            used[module].update(names)
+
+            # Handle star imports
+            if '*' in names:
+                stars.add(module)
+                exports = files[module].summary.exports
+                if exports is None:
+                    warnings.append(Diagnostic(pyfile.filename, lineno, None, 'star-import-no-all',
+                                               'star import with no __all__ in %s' % module))
+                    exports = files[module].summary.implicit_exports
+
+                if pyfile.is_entry:
+                    if summary.exports:
+                        used[module].update(set(exports) & set(summary.exports))
+                    else:
+                        used[module].update(exports)
+                else:
+                    used[module].update(name for name in exports if name in star_uses)
+
+        # Names looked up on imported modules, `mod.name` or `mod.submod.name`
+        for module, name in uses:
+            used[module].add(name)
+
+    # Direct usage
+    used[pyfile.package].update(name for name, (_, _, is_used) in summary.names.items()
+                                if is_used)
+
+    # Entry point usage
+    if pyfile.is_entry:
+        # TODO: warn about no __all__ in entry point?
+        exports = summary.exports or summary.implicit_exports
+        used[pyfile.package].update(exports)
+
+    return used, stars, warnings
+
+
+def defined_names(pyfile):
+    return [name for name in pyfile.summary.names if name not in IGNORED_VARS]
+
+def unused_flaws(pyfile, unused, ids):
+    """
+    Reports names defined in a file, which bits are set in unused mask.
+    """
+    if not unused:
+        return []
+    # A string of bits, least significant first
+    bits = bin(unused)[:1:-1].ljust(len(ids), '0')
+    return [Diagnostic(pyfile.filename, lineno, None, 'unused-global',
+                       '%s %s is never used (globally)' % (kind, name))
+            for name, (lineno, kind, _) in pyfile.summary.names.items()
+            if name in ids and bits[ids[name]] == '1']
+
+
+def names_mask(ids, names):
+    """
+    Returns an int with a bit set for each of distinct names,
+    new names are added to ids {name: bit}.
+    """
+    # Shifting and or-ing ints is quadratic, so many names are set in a string of bits
+    if len(names) <= 64:
+        mask = 0
+        for name in names:
+            bit = ids.get(name)
+            if bit is None:
+                bit = ids[name] = len(ids)
+            mask |= 1 << bit
+        return mask
+
+    new = set(names).difference(ids)
+    if new:
+        ids.update(zip(sorted(new), count(len(ids))))
+    bits = bytearray(b'0') * len(ids)
+    one = ord('1')
+    for bit in map(ids.__getitem__, names):
+        bits[bit] = one
+    bits.reverse()
+    return int(bits.decode('ascii'), 2)
+
+
+class UsageIndex(object):
+    """
+    A reverse index of which modules use which names of which module.
+
+    Persisted in cache, it lets global pass only reevaluate modules touched by changed files.
+    It is keyed by a set of packages, since it determines how imports resolve,
+    along with their filenames, which stored diagnostics refer to.
+
+    Names used are kept as int bitsets, each module numbering its names in order of appearance.
+    Numbers are never reused, so that bitsets stay valid when a module changes.
+    """
+    def __init__(self, key=None):
+        self.key = key
+        self.files = {}         # package -> (filename, mtime, size, cache key)
+        self.keys = {}          # package -> (is_entry, cache key)
+        self.name_ids = {}      # module -> {name: bit}
+        self.defined = {}       # package -> names mask
+        self.used_by = {}       # module -> {package: names mask}
+        self.uses = {}          # package -> modules it uses names from
+        self.stars = {}         # module -> packages star importing it
+        self.warnings = {}      # package -> diagnostics
+        self.plugin_used = {}   # module -> names mask
+        self.plugin_errors = []
+        self.verdicts = {}      # package -> diagnostics
+
+    @classmethod
+    def load(cls, files):
+        if not files.cache:
+            return cls()
+
+        # Stored diagnostics refer to files by their names as passed, e.g. pkg/a.py or ./pkg/a.py
+        key = files.cache.hash(repr(sorted((package, pyfile.filename)
+                                           for package, pyfile in files.items())).encode('utf-8'))
+        index = files.cache.get(key) or cls(key)
+        index.stat(files)
+        return index
+
+    def stat(self, files):
+        """
+        Reuses content hashes of files not modified since last save.
+        """
+        self._stats = {}
+        for package, pyfile in files.items():
+            # In-memory sources differ from what's on disk
+            if pyfile.source is not None:
+                continue
+            try:
+                st = os.stat(pyfile.filename)
+            except EnvironmentError:
+                continue
+            self._stats[package] = stat = (pyfile.filename, st.st_mtime, st.st_size)
+            if package in self.files and self.files[package][:3] == stat:
+                pyfile.cache_key = self.files[package][3]
+
+    def save(self, files):
+        if files.cache:
+            self.files = {package: self._stats[package] + (pyfile.cache_key,)
+                          for package, pyfile in files.items() if package in self._stats}
+            del self._stats
+            files.cache.set(self.key, self)
+
+    def update(self, files):
+        """
+        Updates index for changed files and reevaluates affected modules.
+        """
+        keys = {package: (pyfile.is_entry, _version(files, pyfile))
+                for package, pyfile in files.items()}
+        changed = {package for package, key in keys.items()
+                   if key[1] is None or self.keys.get(package) != key}
+        # Star imports depend on exports of an imported module
+        dirty = changed.union(*(self.stars.get(module, ()) for module in changed))
+        self.keys = keys
+
+        affected = set(changed)
+        for package in dirty:
+            # Forget old usages
+            for module in self.uses.pop(package, ()):
+                self.used_by[module].pop(package, None)
+                self.stars.get(module, set()).discard(package)
+                affected.add(module)
+
+            try:
+                used, stars, self.warnings[package] = file_usage(files[package], files)
+                self.defined[package] = self._mask(package, defined_names(files[package]))
+            except Exception as e:
+                used, stars = {}, set()
+                self.defined[package] = 0
+                self.warnings[package] = [Diagnostic(
+                    files[package].filename, 1, None, 'internal-error',
+                    'analysis failed with %s: %s' % (e.__class__.__name__, e))]
+            self.uses[package] = set(used) | stars
+            for module, names in used.items():
+                self.used_by.setdefault(module, {})[package] = self._mask(module, names)
+            for module in stars:
+                self.stars.setdefault(module, set()).add(package)
+            affected.update(used)
+
+        # Plugins look at everything, so we rerun them and compare results
+        plugin_used = defaultdict(set)
+        self.plugin_errors = run_global_usage(files, plugin_used)
+        plugin_used = {module: self._mask(module, names) for module, names in plugin_used.items()}
+        affected.update(module for module in set(plugin_used) | set(self.plugin_used)
+                        if plugin_used.get(module) != self.plugin_used.get(module))
+        self.plugin_used = plugin_used
+
+        for package in affected & set(files):
+            used = self.plugin_used.get(package, 0)
+            for mask in self.used_by.get(package, {}).values():
+                used |= mask
+            self.verdicts[package] = unused_flaws(files[package], self.defined[package] & ~used,
+                                                  self.name_ids.get(package, {}))
+        return affected
+
+    def _mask(self, module, names):
+        return names_mask(self.name_ids.setdefault(module, {}), names)
+
+
+def _version(files, pyfile):
+    """
+    Tells whether a file changed: by content hash if there is cache, by stat otherwise.
+    """
+    if files.cache:
+        return pyfile.cache_key
+    elif pyfile.source is not None:
+        return hashlib.sha1(pyfile.source).hexdigest()
+    try:
+        st = os.stat(pyfile.filename)
+        return st.st_mtime, st.st_size
+    except EnvironmentError:
+        return None
+
+
+def local_usage(files, jobs=None):
+    for _, diags in files.map(local_flaws, jobs):
+        for diag in diags:
+            yield diag
+
+
+def local_flaws(pyfile):
+    pyfile.scope
+    with profiler.phase('local', pyfile.filename):
+        return _local_flaws(pyfile)
+
+@collecting
+def _local_flaws(pyfile):
+    for error in pyfile.errors:
+        yield Diagnostic(pyfile.filename, *error)
+    if pyfile.scope.bad_exports:
+        yield Diagnostic(pyfile.filename, pyfile.scope.bad_exports.lineno, None, 'bad-all',
+                         'failed parsing __all__')
+
+    for scope, name, nodes in pyfile.scope.walk():
+        node = nodes[0]
+        if all(is_use, nodes) and not scope.is_global(name) and not scope.sees_stars:
+            yield Diagnostic(pyfile.filename, node.lineno, node.col_offset, 'undefined-variable',
+                             'undefined variable %s' % name)
+        if not scope.is_class and all(is_write, nodes):
+            if name == '_' or scope.is_module and re.search(r'^__\w+__$', name):
+                continue
+            elif scope.exports is not None and name in scope.exports:
+                continue
+            elif scope.exports is None and not name.startswith('_') and not is_import(node):
+                continue
+            # NOTE: skipping all params for now as this gets too many false positives:
+            #       protocols, overriden methods, signal handlers, etc.
+            elif is_param(node):
+                continue
+            # # TODO: check that it is method/classmethod
+            # elif is_param(node) and name in {'self', 'cls', 'kwargs', 'request'}:
+            #     continue
+            # BUG: shows unused import when it's meant for reexport
+            yield Diagnostic(pyfile.filename, node.lineno, node.col_offset, 'unused-local',
+                             '%s %s is never used' % (name_class(node), name))
 
 
 # File utils
 
 class FileSet(dict):
-    def __init__(self, roots, base=None, ignore=None, entry_points=None):
-        ignore_re = re.compile(ignore) if ignore else None
+    def __init__(self, roots, base=None, ignore=None, entry_points=None, cache_dir=None,
+                 low_memory=False, exclude=None, gitignore=False, sources=None):
+        """
+        Sources are {filename: bytes} to use instead of files on disk, e.g. unsaved editor buffers.
+        """
+        ignore = Ignore(ignore, exclude or (), gitignore)
+        self.cache = Cache(cache_dir) if cache_dir else None
+        self.low_memory = low_memory
         entry_points = set((entry_points or '').split(','))
 
-        for root in roots:
-            if root.endswith('.py'):
-                entry_point = root
-                files = [root]
-                root = os.path.dirname(root)
-            else:
-                entry_point = os.path.join(root, '__init__.py')
-                if os.path.isfile(entry_point):
-                    # Guess base
-                    if base is None:
-                        base = os.path.dirname(os.path.normpath(root))
-                        if base == '':
-                            base = '.'
+        with profiler.phase('discover'):
+            for root in roots:
+                if root.endswith('.py'):
+                    entry_point = root
+                    files = [] if ignore(root) else [root]
+                    root = os.path.dirname(root)
                 else:
-                    entry_point = None
+                    entry_point = os.path.join(root, '__init__.py')
+                    if os.path.isfile(entry_point):
+                        # Guess base
+                        if base is None:
+                            base = os.path.dirname(os.path.normpath(root))
+                            if base == '':
+                                base = '.'
+                    else:
+                        entry_point = None
+
+                    files = walk_files(root, ignore=ignore)
+
+                for filename in files:
+                    pyfile = File(base or root, filename, entry_point == filename, self.cache)
+                    self[pyfile.package] = pyfile
+                    if pyfile.package in entry_points:
+                        pyfile.is_entry = True
+                    if sources:
+                        pyfile.source = sources.get(os.path.realpath(filename))
+
+    def map(self, func, jobs=None):
+        with BulkGC() as bulk:
+            for package, result in map_files(func, self.values(), jobs):
+                if self.low_memory:
+                    self[package].release()
+                bulk.step()
+                yield package, result
+
+    def summarize(self, jobs=None):
+        """
+        Makes sure all files have summaries, building them in parallel if jobs > 1.
+        """
+        todo = [pyfile for pyfile in self.values() if 'summary' not in pyfile.__dict__]
+        if self.cache:
+            for pyfile in todo:
+                summary = self.cache.get(pyfile.cache_key)
+                if summary is not None:
+                    pyfile.summary = summary
+            todo = [pyfile for pyfile in todo if 'summary' not in pyfile.__dict__]
+
+        with BulkGC() as bulk:
+            for package, summary in map_files(get_summary, todo, jobs):
+                self[package].summary = summary
+                # Only summaries are needed for global analysis
+                if self.low_memory:
+                    self[package].release()
+                bulk.step()
+
+    @cached_property
+    def modules(self):
+        return ModuleTable(self)
 
-                files = walk_files(root)
+    # Queries, these only build scopes of files involved
 
-            for filename in files:
-                if ignore_re and ignore_re.search(filename):
-                    continue
-                pyfile = File(base or root, filename, entry_point == filename)
-                self[pyfile.package] = pyfile
-                if pyfile.package in entry_points:
-                    pyfile.is_entry = True
+    def scope_of(self, module):
+        return self[module].scope
 
-    # def resolve_ref(self, module, name):
-    #     pyfile = self[module]
-    #     if name in pyfile.scope.names:
-    #         return module, name
-    #     else:
-    #         # ...
+    def find_uses(self, module, name):
+        """
+        Returns a sorted list of (module, node) pairs using name defined in module.
+        """
+        return find_uses(self, module, name)
 
 
 class File(object):
-    def __init__(self, base, filename, is_entry):
+    # Both are (lineno, col, code, message)
+    parse_error = None
+    failure = None
+    # In-memory source overriding the file on disk
+    source = None
+
+    def __init__(self, base, filename, is_entry, cache=None):
         self.base = base
         self.filename = filename
         self.is_entry = is_entry
+        self.cache = cache
         self.package, self.dotname = path_to_package(os.path.relpath(filename, base))
 
     def __str__(self):
@@ -210,25 +423,239 @@ class File(object):
 
     @cached_property
     def tree(self):
-        source = slurp(self.filename)
-        return ast.parse(source, filename=self.filename)
-
+        if self.failure:
+            tree = ast.Module(body=[])
+        else:
+            with profiler.phase('read', self.filename):
+                source = self.read()
+            with profiler.phase('parse', self.filename):
+                try:
+                    tree = ast.parse(source, filename=self.filename)
+                except (SyntaxError, ValueError) as e:
+                    # Go on with an empty module, reporting the error
+                    self.parse_error = (getattr(e, 'lineno', None) or 1,
+                                        e.offset - 1 if getattr(e, 'offset', None) else None,
+                                        'syntax-error', getattr(e, 'msg', None) or str(e))
+                    tree = ast.Module(body=[])
+        with profiler.phase('link', self.filename):
+            TreeLinker().visit(tree)
+        return tree
+
+    def read(self):
+        return self.source if self.source is not None else slurp(self.filename)
+
+    @property
+    def index(self):
+        return self.tree.index
 
     @cached_property
     def scope(self):
-        fill_scopes(self.tree)
-        return self.tree.scope
+        tree = self.tree
+        with profiler.phase('scopes', self.filename):
+            build_scopes(tree)
+        return tree.scope
 
+    @cached_property
+    def summary(self):
+        with profiler.phase('cache', self.filename):
+            summary = self.cache.get(self.cache_key) if self.cache else None
+        if summary is None:
+            scope = self.scope
+            with profiler.phase('summary', self.filename):
+                summary = Summary(scope, errors=self.errors)
+            # Failures might be transient, so these are never cached
+            if self.cache and not self.failure:
+                with profiler.phase('cache', self.filename):
+                    self.cache.set(self.cache_key, summary)
+        return summary
 
-def walk_files(path, ext='.py'):
+    @cached_property
+    def cache_key(self):
+        if self.source is not None:
+            return self.cache.hash(self.source)
+        try:
+            return self.cache.key(self.filename)
+        except EnvironmentError:
+            # Not cached then, reading the file in .tree reports the error
+            return None
+
+    @property
+    def errors(self):
+        return tuple(error for error in (self.parse_error, self.failure) if error)
+
+    def fail(self, message):
+        """
+        Marks file as failed to analyze, from now on it is seen as an empty module with an error.
+        """
+        self.failure = (1, None, 'internal-error', message)
+        self.release()
+        self.__dict__.pop('summary', None)
+
+    def release(self):
+        """
+        Drops tree and scopes, these will be rebuilt if accessed again.
+        """
+        self.__dict__.pop('tree', None)
+        self.__dict__.pop('scope', None)
+
+
+def get_summary(pyfile):
+    return pyfile.summary
+
+
+def map_files(func, pyfiles, jobs=None):
+    """
+    Yields (package, func(pyfile)) pairs ordered by package, uses a process pool if jobs > 1.
+    Results should be picklable in the latter case.
+
+    Files failing analysis are seen as empty modules with errors, see isolate().
+    A crashed worker is replaced and files it was working on are retried,
+    a file crashing a worker on its own is then treated as failed.
+    """
+    pyfiles = sorted(pyfiles, key=lambda f: f.package)
+    if not jobs or jobs <= 1:
+        for pyfile in progress(pyfiles):
+            yield pyfile.package, isolate(func, pyfile)
+        return
+
+    ProcessPoolExecutor, BrokenProcessPool = _process_pool()
+    chunksize = max(1, len(pyfiles) // (jobs * 8))
+    chunks = [pyfiles[i:i + chunksize] for i in range(0, len(pyfiles), chunksize)]
+    futures = [None] * len(chunks)
+    executor = None
+    bar = progress(total=len(pyfiles))
+    try:
+        i = 0
+        while i < len(chunks):
+            if executor is None:
+                executor = ProcessPoolExecutor(jobs)
+                for j in range(i, len(chunks)):
+                    if not _succeeded(futures[j]):
+                        futures[j] = executor.submit(_apply_chunk, func, chunks[j])
+
+            try:
+                results = futures[i].result()
+            except BrokenProcessPool:
+                executor.shutdown(wait=False)
+                executor = None
+                chunk = chunks[i]
+                if len(chunk) > 1:
+                    # Retry files one by one to find out which one crashes
+                    chunks[i:i + 1] = [[pyfile] for pyfile in chunk]
+                    futures[i:i + 1] = [None] * len(chunk)
+                    continue
+                results = _retry_alone(func, chunk[0])
+
+            for result in results:
+                yield result
+            bar.update(len(results))
+            futures[i] = None
+            i += 1
+    finally:
+        bar.close()
+        if executor is not None:
+            for future in futures:
+                if future is not None:
+                    future.cancel()
+            executor.shutdown()
+
+def _process_pool():
+    # Imported here as these take a while and are only needed with jobs > 1
+    from concurrent.futures import ProcessPoolExecutor, process
+    # Not present in futures backport
+    BrokenProcessPool = getattr(process, 'BrokenProcessPool', _NeverRaised)
+    return ProcessPoolExecutor, BrokenProcessPool
+
+class _NeverRaised(Exception):
+    pass
+
+def _succeeded(future):
+    return future is not None and future.done() and not future.cancelled() \
+        and future.exception() is None
+
+def _retry_alone(func, pyfile):
+    # Might have been killed with other files, so check it in a separate pool
+    ProcessPoolExecutor, BrokenProcessPool = _process_pool()
+    executor = ProcessPoolExecutor(1)
+    try:
+        return executor.submit(_apply_chunk, func, [pyfile]).result()
+    except BrokenProcessPool:
+        pyfile.fail('worker process crashed analyzing this file')
+        return [(pyfile.package, func(pyfile))]
+    finally:
+        executor.shutdown(wait=False)
+
+def _apply_chunk(func, pyfiles):
+    results = []
+    with BulkGC() as bulk:
+        for pyfile in pyfiles:
+            results.append((pyfile.package, isolate(func, pyfile)))
+            bulk.step()
+    return results
+
+
+def isolate(func, pyfile):
+    """
+    Calls func(pyfile), if that fails marks file failed and calls func again.
+    """
+    try:
+        return func(pyfile)
+    except Exception as e:
+        if pyfile.failure:
+            raise
+        pyfile.fail('analysis failed with %s: %s' % (e.__class__.__name__, e))
+        return func(pyfile)
+
+
+def walk_files(path, ext='.py', ignore=None):
+    """
+    Yields files with ext under path, skipping hidden and ignored ones.
+    Ignored dirs are pruned, honors .gitignore if ignore says so, via git ls-files when possible.
+    """
+    ignore = ignore or Ignore()
+
+    if ignore.gitignore:
+        rels = git_files(path)
+        if rels is not None:
+            for filename in _filter_rels(path, rels, ext, ignore):
+                yield filename
+            return
+
+    # .gitignore rules loaded while walking are only relevant for this path
+    ignore = ignore.copy()
     for root, dirs, files in os.walk(path):
-        for d in dirs:
-            if d.startswith('.'):
-                dirs.remove(d)
+        rel_root = os.path.relpath(root, path)
+        rel_root = '' if rel_root == '.' else rel_root + '/'
+        if ignore.gitignore:
+            ignore.load_gitignore(root, rel_root.rstrip('/'))
+
+        dirs[:] = [d for d in dirs if not d.startswith('.')
+                   and not ignore(os.path.join(root, d), rel_root + d, is_dir=True)]
         for f in files:
-            if f.endswith(ext):
+            if f.endswith(ext) and not ignore(os.path.join(root, f), rel_root + f):
                 yield os.path.join(root, f)
 
+def _filter_rels(path, rels, ext, ignore):
+    dir_ignored = {'': False}
+
+    def is_ignored_dir(rel):
+        if rel not in dir_ignored:
+            parent, name = rel.rpartition('/')[::2]
+            dir_ignored[rel] = is_ignored_dir(parent) or name.startswith('.') \
+                or ignore(os.path.join(path, rel), rel, is_dir=True)
+        return dir_ignored[rel]
+
+    for rel in rels:
+        if not rel.endswith(ext):
+            continue
+        dirname, name = rel.rpartition('/')[::2]
+        if is_ignored_dir(dirname) or ignore(os.path.join(path, rel), rel):
+            continue
+        filename = os.path.join(path, rel)
+        # Deleted files are still listed if they are not commited
+        if os.path.isfile(filename):
+            yield filename
+
 
 def path_to_package(path):
     dotname = re.sub(r'^\./|\.py$', '', path).replace('/', '.')
@@ -1,4 +1,5 @@
 import ast
+import sys
 try:
     from ast import arg as ast_arg
 except ImportError:
@@ -6,10 +7,26 @@ except ImportError:
 
 from funcy.py3 import lmap
 
+
+# Python 3.8+ parses all literals to ast.Constant, ast.Str, ast.Num and friends are
+# deprecated aliases with slow isinstance() checks, some of them are removed later
+MODERN_AST = sys.version_info >= (3, 8)
+
+AsyncFunctionDef = getattr(ast, 'AsyncFunctionDef', ())
+FUNCTION_DEFS = (ast.FunctionDef, AsyncFunctionDef)
+COMPREHENSIONS = tuple(getattr(ast, name) for name in ['ListComp', 'SetComp', 'DictComp',
+                                                       'GeneratorExp'] if hasattr(ast, name))
+# Match statement captures, these hold names as strings
+MATCH_CAPTURES = tuple(getattr(ast, name) for name in ['MatchAs', 'MatchStar', 'MatchMapping']
+                       if hasattr(ast, name))
+Param = getattr(ast, 'Param', ())
+
+
 def is_write(node):
     return isinstance(node, (ast.Import, ast.ImportFrom, ast.ExceptHandler,
-                             ast.FunctionDef, ast.ClassDef, ast.arguments, ast_arg)) \
-        or isinstance(node.ctx, (ast.Store, ast.Del, ast.Param))
+                             ast.FunctionDef, AsyncFunctionDef, ast.ClassDef,
+                             ast.arguments, ast_arg) + MATCH_CAPTURES) \
+        or isinstance(node.ctx, (ast.Store, ast.Del, Param))
 
 def is_read(node):
     return isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load)
@@ -22,7 +39,7 @@ def is_constant(node):
     return isinstance(node, ast.Name) and node.id.isupper()
 
 def is_param(node):
-    return isinstance(node, ast.Name) and isinstance(node.ctx, ast.Param) \
+    return isinstance(node, ast.Name) and isinstance(node.ctx, Param) \
         or isinstance(node, (ast.arguments, ast_arg))
 
 def is_import(node):
@@ -35,13 +52,32 @@ def is_call(node, name):
     return isinstance(node, ast.Call) and is_name(node.func, name)
 
 
+if MODERN_AST:
+    def is_str(node):
+        return type(node) is ast.Constant and isinstance(node.value, str)
+
+    def is_num(node):
+        return type(node) is ast.Constant and isinstance(node.value, (int, float, complex)) \
+            and not isinstance(node.value, bool)
+
+    def literal_value(node):
+        return node.value
+else:
+    def is_str(node):
+        return isinstance(node, ast.Str)
+
+    def is_num(node):
+        return isinstance(node, ast.Num)
+
+    def literal_value(node):
+        return node.s if isinstance(node, ast.Str) else node.n
+
+
 def ast_eval(node):
     if isinstance(node, (ast.List, ast.Tuple)):
         return lmap(ast_eval, node.elts)
-    elif isinstance(node, ast.Str):
-        return node.s
-    elif isinstance(node, ast.Num):
-        return node.n
+    elif is_str(node) or is_num(node):
+        return literal_value(node)
     else:
         raise ValueError("Don't know how to eval %s" % node.__class__.__name__)
 
@@ -49,7 +85,7 @@ def ast_eval(node):
 def name_class(node):
     if isinstance(node, (ast.Import, ast.ImportFrom)):
         return 'import'
-    elif isinstance(node, ast.FunctionDef):
+    elif isinstance(node, FUNCTION_DEFS):
         return 'function'
     elif isinstance(node, ast.ClassDef):
         return 'class'
@@ -90,23 +126,12 @@ def func_file(func):
 
 # Code generation
 
-try:
-    from astor.code_gen import SourceGenerator
-except ImportError:
-    from astor.codegen import SourceGenerator
-from termcolor import colored
-
 def to_source(node, indent_with=' ' * 4, add_line_information=False):
     """
     A modified to_source() function from astor.
     """
+    # astor and termcolor are only imported when code is generated
+    from .codegen import AnnotatedSourceGenerator
     generator = AnnotatedSourceGenerator(indent_with, add_line_information)
     generator.visit(node)
     return ''.join(str(s) for s in generator.result)
-
-
-class AnnotatedSourceGenerator(SourceGenerator):
-    def visit(self, node):
-        SourceGenerator.visit(self, node)
-        if not isinstance(node, (ast.Num, ast.Str)) and hasattr(node, 'val'):
-            self.write(colored(' (%s)' % node.val, 'green'))
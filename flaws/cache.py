@@ -0,0 +1,66 @@
+import os
+import sys
+import hashlib
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from . import __version__
+from .utils import atomic_write
+
+# Bump this on any changes to what is stored
+FORMAT = 7
+
+
+class Cache(object):
+    """
+    Stores analysis results on disk keyed by content, flaws and python versions.
+
+    Caching is best-effort: if path can't be written to, that is warned about once
+    and nothing is written anymore. None keys, of files failed to read, are never cached.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.broken = False
+        self.salt = ('%s\0%s\0%s\0' % (__version__, FORMAT, sys.version)).encode('utf-8')
+
+    def key(self, filename):
+        with open(filename, 'rb') as f:
+            return self.hash(f.read())
+
+    def hash(self, data):
+        return hashlib.sha1(self.salt + data).hexdigest()
+
+    def get(self, key):
+        if key is None:
+            return None
+        try:
+            with open(self._filename(key), 'rb') as f:
+                return pickle.load(f)
+        except (EnvironmentError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def set(self, key, value):
+        if self.broken or key is None:
+            return
+        try:
+            self._set(key, value)
+        except EnvironmentError as e:
+            self.broken = True
+            sys.stderr.write('WARNING: failed writing cache to %s, going on without it: %s\n'
+                             % (self.path, e))
+
+    def _set(self, key, value):
+        filename = self._filename(key)
+        dirname = os.path.dirname(filename)
+        if not os.path.isdir(dirname):
+            try:
+                os.makedirs(dirname)
+            except OSError:
+                # Created concurrently
+                pass
+        atomic_write(filename, pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+    def _filename(self, key):
+        return os.path.join(self.path, key[:2], key[2:])
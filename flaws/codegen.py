@@ -0,0 +1,17 @@
+try:
+    from astor.code_gen import SourceGenerator
+except ImportError:
+    from astor.codegen import SourceGenerator
+from termcolor import colored
+
+from .asttools import is_str, is_num
+
+
+class AnnotatedSourceGenerator(SourceGenerator):
+    """
+    Annotates generated code with inferred values of nodes.
+    """
+    def visit(self, node):
+        SourceGenerator.visit(self, node)
+        if not (is_str(node) or is_num(node)) and hasattr(node, 'val'):
+            self.write(colored(' (%s)' % node.val, 'green'))
@@ -0,0 +1,61 @@
+import sys
+import json
+from collections import namedtuple
+
+
+class Diagnostic(namedtuple('Diagnostic', 'filename line col code message')):
+    __slots__ = ()
+
+    def __str__(self):
+        if self.col is None:
+            return '%s:%d: %s' % (self.filename, self.line, self.message)
+        else:
+            return '%s:%d:%d: %s' % (self.filename, self.line, self.col, self.message)
+
+
+# Sinks, all of them write diagnostics as soon as they come
+
+def text_sink(diagnostics, out=None):
+    out = out or sys.stdout
+    for diag in diagnostics:
+        out.write(str(diag) + '\n')
+        out.flush()
+
+def jsonl_sink(diagnostics, out=None):
+    out = out or sys.stdout
+    for diag in diagnostics:
+        out.write(json.dumps(diag._asdict()) + '\n')
+        out.flush()
+
+def sarif_sink(diagnostics, out=None):
+    from . import __version__
+
+    out = out or sys.stdout
+    out.write('{"version": "2.1.0", '
+              '"$schema": "https://json.schemastore.org/sarif-2.1.0.json", "runs": [{'
+              '"tool": {"driver": {"name": "flaws", "version": "%s", '
+              '"informationUri": "https://github.com/Suor/flaws"}}, '
+              '"results": [' % __version__)
+    for i, diag in enumerate(diagnostics):
+        region = {'startLine': diag.line}
+        if diag.col is not None:
+            region['startColumn'] = diag.col + 1
+        result = {
+            'ruleId': diag.code,
+            'level': 'warning',
+            'message': {'text': diag.message},
+            'locations': [{'physicalLocation': {
+                'artifactLocation': {'uri': diag.filename},
+                'region': region,
+            }}],
+        }
+        out.write((', ' if i else '') + json.dumps(result))
+        out.flush()
+    out.write(']}]}\n')
+
+
+SINKS = {
+    'text': text_sink,
+    'jsonl': jsonl_sink,
+    'sarif': sarif_sink,
+}
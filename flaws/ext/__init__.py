@@ -1,10 +1,41 @@
+from importlib import import_module
+
+from ..diagnostics import Diagnostic
+from ..profiling import profiler
+
+
 GLOBAL_USAGE = []
 
+# Plugins are only imported when enabled
+PLUGINS = {
+    'django': '.django',
+}
+
+
+def load_plugins(names, args, opts):
+    for name in names:
+        if name not in PLUGINS:
+            raise ValueError('Unknown plugin %s, known are: %s'
+                             % (name, ', '.join(sorted(PLUGINS))))
+        import_module(PLUGINS[name], __name__).register(args, opts)
+
 
 def register_global_usage(func):
     GLOBAL_USAGE.append(func)
 
 
 def run_global_usage(files, used):
+    """
+    Runs all plugins, a failing one doesn't stop others.
+    Returns diagnostics for failed plugins.
+    """
+    errors = []
     for func in GLOBAL_USAGE:
-        func(files, used)
+        name = getattr(func, 'func', func).__module__.rsplit('.', 1)[-1]
+        with profiler.phase('plugin:%s' % name):
+            try:
+                func(files, used)
+            except Exception as e:
+                errors.append(Diagnostic('<plugin %s>' % name, 1, None, 'plugin-error',
+                                         'plugin failed with %s: %s' % (e.__class__.__name__, e)))
+    return errors
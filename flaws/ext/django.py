@@ -1,9 +1,9 @@
 import ast
 import re
 
-from funcy.py2 import partial, cat, ikeep, project, imapcat, any
+from funcy.py2 import partial, cat, ikeep, project
 
-from ..asttools import ast_eval, is_name, is_call
+from ..asttools import ast_eval, is_name, is_call, is_str, literal_value
 from . import register_global_usage
 
 
@@ -17,11 +17,13 @@ def global_usage(files, used, opts={}):
 
     # Mark default app confs
     for package, pyfile in files.items():
-        if 'default_app_config' in pyfile.scope.names:
+        if 'default_app_config' in pyfile.summary.names:
             used[package].add('default_app_config')
 
-            conf = ast_eval(pyfile.scope.names['default_app_config'][0].up.value)
-            _mark_refs(files, used, [conf])
+            # Not a literal value, can't follow it
+            conf = pyfile.summary.values.get('default_app_config')
+            if conf is not None:
+                _mark_refs(files, used, [conf])
 
     # Mark migrations
     for package, _ in files.items():
@@ -40,18 +42,11 @@ def global_usage(files, used, opts={}):
 
 
 def mark_registered(files, used):
-    def is_register(node):
-        reg_names = {'register', 'library', 'receiver'}
-        return isinstance(node, ast.Name) and node.id in reg_names \
-            or isinstance(node, ast.Attribute) and node.attr in reg_names
+    reg_names = {'register', 'library', 'receiver'}
 
     for package, pyfile in files.items():
-        for name, nodes in pyfile.scope.names.items():
-            adef = nodes[0]
-            if not is_def(adef):
-                continue
-
-            if any(is_register, imapcat(ast.walk, adef.decorator_list)):
+        for name, decorators in pyfile.summary.decorators.items():
+            if decorators & reg_names:
                 used[package].add(name)
 
 
@@ -59,17 +54,13 @@ def mark_used_settings(files, used, opts={}):
     settings = files.get(opts.get('settings'))
 
     if settings:
-        for name, nodes in settings.scope.names.items():
-            node = nodes[0]
-            if is_store(node) and node.id.isupper():
+        for name, strings in settings.summary.assigns.items():
+            if name.isupper():
                 used[settings.package].add(name)
 
                 # Things refered by their string path
-                if isinstance(node.up, ast.Assign):
-                    refs = [n.s for n in ast.walk(node.up.value)
-                                if isinstance(n, ast.Str) and re.search(r'^\w+(?:\.\w+)+$', n.s)]
-
-                    _mark_refs(files, used, refs)
+                refs = [s for s in strings if re.search(r'^\w+(?:\.\w+)+$', s)]
+                _mark_refs(files, used, refs)
 
 def mark_used_views(files, used, opts={}):
     settings = files.get(opts.get('settings'))
@@ -77,7 +68,7 @@ def mark_used_views(files, used, opts={}):
 
     # Get root urlconf from settings, the check is needed in case
     if settings:
-        root_urlconf = get_name_val(settings.scope.names['ROOT_URLCONF'][0])
+        root_urlconf = get_name_val(settings, 'ROOT_URLCONF')
         if root_urlconf in files:
             urlconfs.append(root_urlconf)
     # Get urlconf from options
@@ -92,16 +83,17 @@ def mark_used_views(files, used, opts={}):
 
 def _parse_urlconf(files, urlconf):
     # Old patterns() call, TODO: drop them
-    patterns = [n for n in ast.walk(urlconf.tree) if is_call(n, 'patterns')]
+    calls = urlconf.index.calls
+    patterns = [n for n in calls['patterns'] if is_call(n, 'patterns')]
     if patterns:
         return cat(_parse_patterns(files, p) for p in patterns)
 
     # NOTE that we don't support mixing patterns() and new style in single file
-    refs = [n.args[1].s for n in ast.walk(urlconf.tree) if is_call(n, 'url') and
-            len(n.args) >= 2 and isinstance(n.args[1], ast.Str)]
+    refs = [literal_value(n.args[1]) for n in calls['url'] if is_call(n, 'url') and
+            len(n.args) >= 2 and is_str(n.args[1])]
 
-    included = [n.args[0].s for n in ast.walk(urlconf.tree) if is_call(n, 'include') and
-                len(n.args) >= 1 and isinstance(n.args[0], ast.Str)]
+    included = [literal_value(n.args[0]) for n in calls['include'] if is_call(n, 'include') and
+                len(n.args) >= 1 and is_str(n.args[0])]
     for mod in included:
         if mod in files:
             refs.append('%s.urlpatterns' % mod)
@@ -110,17 +102,17 @@ def _parse_urlconf(files, urlconf):
     return refs
 
 def _parse_patterns(files, call_node):
-    if len(call_node.args) < 2 or not isinstance(call_node.args[0], ast.Str):
+    if len(call_node.args) < 2 or not is_str(call_node.args[0]):
         return []
 
     views_module = ast_eval(call_node.args[0])
     refs = []
 
     for node in ikeep(_parse_urlrec, ast.walk(call_node)):
-        if isinstance(node, ast.Str):
+        if is_str(node):
             refs.append(ast_eval(node))
         elif isinstance(node, ast.Call) and is_name(node.func, 'include') \
-                and len(node.args) >= 1 and isinstance(node.args[0], ast.Str):
+                and len(node.args) >= 1 and is_str(node.args[0]):
             subconf = ast_eval(node.args[0])
             if subconf in files:
                 refs.append('%s.urlpatterns' % subconf)
@@ -140,23 +132,10 @@ def _parse_urlrec(node):
 
 def _mark_refs(files, used, refs):
     for ref in refs:
-        module, func = ref.rsplit('.', 1)
-        if module in files:
-            used[module].add(func)
-
-
-def get_name_val(node):
-    assert isinstance(node, ast.Name) and isinstance(node.up, ast.Assign)
-
-    assign = node.up
-    assert len(assign.targets) == 1
-
-    return ast_eval(assign.value)
-
+        module, name = files.modules.split_ref(ref)
+        if module:
+            used[module].add(name)
 
-def is_store(node):
-    return isinstance(node, ast.Name) \
-            and isinstance(node.ctx, ast.Store)
 
-def is_def(node):
-    return isinstance(node, (ast.FunctionDef, ast.ClassDef))
+def get_name_val(pyfile, name):
+    return pyfile.summary.values.get(name)
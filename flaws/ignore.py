@@ -0,0 +1,102 @@
+import os
+import re
+import subprocess
+
+
+class Ignore(object):
+    """
+    Decides which files and dirs to skip: by --ignore regex, gitignore-style --exclude patterns
+    and, if asked, .gitignore files.
+
+    Paths are checked by full path against regex and by path relative to walked root
+    against patterns. Dirs are checked as well so that ignored trees are not walked at all.
+    """
+    def __init__(self, regex=None, patterns=(), gitignore=False):
+        self.regex = re.compile(regex) if regex else None
+        self.rules = [_compile(pattern, '') for pattern in patterns]
+        self.gitignore = gitignore
+
+    def __call__(self, path, rel=None, is_dir=False):
+        if self.regex and self.regex.search(path + '/' if is_dir else path):
+            return True
+        if rel is None:
+            return False
+
+        ignored = False
+        for base, regex, negate, dir_only in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if base:
+                if not rel.startswith(base):
+                    continue
+                sub = rel[len(base):]
+            else:
+                sub = rel
+            if regex.match(sub):
+                ignored = not negate
+        return ignored
+
+    def copy(self):
+        ignore = Ignore()
+        ignore.regex, ignore.rules, ignore.gitignore = self.regex, self.rules[:], self.gitignore
+        return ignore
+
+    def load_gitignore(self, dirname, rel):
+        filename = os.path.join(dirname, '.gitignore')
+        if os.path.isfile(filename):
+            base = rel + '/' if rel else ''
+            with open(filename) as f:
+                for line in f:
+                    rule = _compile(line, base)
+                    if rule:
+                        self.rules.append(rule)
+
+
+def _compile(pattern, base):
+    """
+    Translates gitignore pattern into (base, regex, negate, dir_only) rule.
+    """
+    pattern = pattern.rstrip('\n').rstrip(' ')
+    if not pattern or pattern.startswith('#'):
+        return None
+
+    negate = pattern.startswith('!')
+    pattern = pattern.lstrip('!')
+    dir_only = pattern.endswith('/')
+    pattern = pattern.rstrip('/')
+    # Patterns without slash match at any level, others are relative to base
+    anchored = '/' in pattern
+    pattern = pattern.lstrip('/')
+
+    regex = ''
+    for token in re.findall(r'\*\*/|/\*\*$|\*|\?|\[[^\]]*\]|[^*?[]+', pattern):
+        if token == '**/':
+            regex += '(?:.*/)?'
+        elif token == '/**':
+            regex += '/.*'
+        elif token == '*':
+            regex += '[^/]*'
+        elif token == '?':
+            regex += '[^/]'
+        elif token.startswith('['):
+            regex += '[^' + token[2:] if token.startswith('[!') else token
+        else:
+            regex += re.escape(token)
+    if not anchored:
+        regex = '(?:.*/)?' + regex
+
+    return base, re.compile(regex + '$'), negate, dir_only
+
+
+def git_files(path):
+    """
+    Lists files under path not ignored by git, returns None if path is not in a git repo.
+    """
+    try:
+        with open(os.devnull, 'w') as devnull:
+            output = subprocess.check_output(
+                ['git', 'ls-files', '-z', '--cached', '--others', '--exclude-standard'],
+                cwd=path, stderr=devnull)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return [rel for rel in output.decode('utf-8').split('\0') if rel]
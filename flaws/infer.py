@@ -102,6 +102,9 @@ class Inferer(astor.ExplicitNodeVisitor):
         node.left.val.add_rel(node.op.__class__.__name__, node.right.val)
         node.val = OPS[node.op.__class__](node.left.val, node.right.val)
 
+    def visit_Constant(self, node):
+        node.val = ValueInfo(node.value)
+
     def visit_Num(self, node):
         node.val = ValueInfo(node.n)
 
@@ -0,0 +1,104 @@
+class ModuleTable(object):
+    """
+    Resolves imports and dotted references to modules of a file set, memoizing results.
+
+    Available as files.modules, so that the global pass and plugins share it.
+    """
+    def __init__(self, files):
+        self.files = files
+        self._modules = {}  # (parent package, module, level, absolute) -> module
+        self._imports = {}  # package -> resolved imports
+        self._refs = {}     # dotted ref -> (module, name)
+
+    def resolve(self, pyfile, module, level):
+        """
+        Returns full name of a module from `from module import ...` in pyfile.
+        """
+        parent = pyfile.dotname.rpartition('.')[0]
+        # TODO: in python 3 it's always absolute
+        absolute = bool(level) or 'absolute_import' in pyfile.summary.future
+        key = (parent, module, level, absolute)
+        if key not in self._modules:
+            self._modules[key] = self._resolve(parent, module, level, absolute)
+        return self._modules[key]
+
+    def _resolve(self, parent, module, level, absolute):
+        if not level:
+            # Try relative import first
+            if not absolute:
+                imported = _rel_import(parent, module, 1)
+                if imported in self.files:
+                    return imported
+            return module
+        else:
+            return _rel_import(parent, module, level)
+
+    def imports(self, pyfile):
+        """
+        Returns resolved imports of a file as a list of (lineno, module, names, star_uses, uses).
+
+        Module and names are only set for from imports, uses are (module, name) pairs
+        for all attributes looked up on imported modules, including submodule chains.
+        """
+        if pyfile.package not in self._imports:
+            self._imports[pyfile.package] = [self._resolve_import(pyfile, info)
+                                             for info in pyfile.summary.imports]
+        return self._imports[pyfile.package]
+
+    def _resolve_import(self, pyfile, info):
+        lineno, is_from, module, level, aliases, star_uses = info
+        uses = set()
+        if is_from:
+            module = self.resolve(pyfile, module, level)
+            names = {name for name, _, _ in aliases}
+            for name, _, chains in aliases:
+                self._chain_uses(uses, '%s.%s' % (module, name), chains)
+        else:
+            module, names = None, ()
+            for name, asname, chains in aliases:
+                self._chain_uses(uses, import_binding(name, asname)[1], chains)
+        return lineno, module, names, star_uses, uses
+
+    def _chain_uses(self, uses, module, chains):
+        for chain in chains:
+            name = module
+            for attr in chain:
+                if name in self.files:
+                    uses.add((name, attr))
+                name = '%s.%s' % (name, attr)
+
+    def split_ref(self, ref):
+        """
+        Splits a dotted reference into the longest module prefix in files and a name in it,
+        returns (None, None) if there is no such module.
+        """
+        if ref not in self._refs:
+            parts = ref.split('.')
+            for i in range(len(parts) - 1, 0, -1):
+                module = '.'.join(parts[:i])
+                if module in self.files:
+                    self._refs[ref] = module, parts[i]
+                    break
+            else:
+                self._refs[ref] = None, None
+        return self._refs[ref]
+
+
+def import_binding(name, asname):
+    """
+    Returns (bound name, module it refers to) for `import name as asname`.
+    """
+    # `import a.b.c` binds a, while `import a.b as x` binds x to a.b
+    if asname:
+        return asname, name
+    bound = name.split('.')[0]
+    return bound, bound
+
+
+def _rel_import(parent, module, level):
+    subs = parent.split('.') if parent else []
+    if level > 1:
+        subs = subs[:-(level - 1)]
+    if module:
+        subs.append(module)
+    return '.'.join(subs)
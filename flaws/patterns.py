@@ -1,13 +1,16 @@
 import ast
 import inspect
+from collections import defaultdict
 
-from funcy.py2 import zipdict, is_list, keep, partial
+from funcy.py2 import zipdict, keep, partial
 from funcy.py3 import lmap
-import astor
 
 from .asttools import get_body_ast
 
 
+getargspec = getattr(inspect, 'getfullargspec', None) or inspect.getargspec
+
+
 class Pattern(object):
     pass
 
@@ -52,60 +55,131 @@ class MapLambda(Pattern):
 
 
 def match(template, tree):
-    stack = []
-    potential = []
-    matches = []
-
-    def _match(node):
-        # Check if any potential fails here
-        next_potential = []
-        for p in potential:
-            if stack[:len(p['stack'])] != p['stack']:
-                # Potential match can't fail
-                matches.append(p)
-            else:
-                path = stack[len(p['stack']):]
-                sub_template = get_sub_template(template, path)
-                if node_matches(node, sub_template, p['context']):
-                    next_potential.append(p)
-        potential[:] = next_potential
-
-        # Check if template starts here
-        context = {'names': {}, 'rev': {}, 'captures': {}}
-        if node_matches(node, template, context):
-            # potential.append((stack[:], node[0]))
-            potential.append({
-                'stack': stack[:],
-                # Always refer to a first node even when template is a list
-                'node': node[0] if is_list(node) else node,
-                'context': context,
-            })
-
-        # Go deeper
-        if isinstance(node, ast.AST):
-            for name, value in ast.iter_fields(node):
-                stack.append(name)
-                _match(value)
-                stack.pop()
-        elif isinstance(node, list) and node:
-            # NOTE: we treat lists as recursive data structures here.
-            #       0 means go to list head, 1 to tail.
-            stack.append(0)
-            _match(node[0])
-            stack.pop()
-
-            stack.append(1)
-            _match(node[1:])
-            stack.pop()
-
-    _match(tree)
-
     results = []
-    for m in matches + potential:
-        m['node'].captures = m['context']['captures']
-        results.append(m['node'])
+    for _, node, captures in Matcher({None: template}).match(tree):
+        node.captures = captures
+        results.append(node)
     return results
 
+
+class Matcher(object):
+    """
+    Finds matches of several compiled templates in a single tree traversal.
+
+    Templates are indexed by their root node type, or by length and head type
+    for statement lists, so only relevant ones are tried at each node.
+    """
+    def __init__(self, templates):
+        self.nodes = defaultdict(list)
+        self.lists = defaultdict(lambda: defaultdict(list))
+        self.any = []
+        for name, template in templates.items():
+            if isinstance(template, ast.AST):
+                self.nodes[type(template)].append((name, template))
+            elif isinstance(template, list):
+                head = template[0] if template else None
+                head_type = type(head) if isinstance(head, ast.AST) else None
+                self.lists[len(template)][head_type].append((name, template))
+            else:
+                self.any.append((name, template))
+
+    def match(self, tree, index=None):
+        """
+        Returns a list of (name, node, captures) triples in traversal order.
+        For statement list templates node is the first matched statement.
+
+        If a NodeIndex of a linked tree is passed, then only nodes of relevant types are looked at
+        and results come in source order.
+        """
+        if index is not None and not self.any and not any(None in h for h in self.lists.values()):
+            return self._match_index(index)
+
+        results = []
+        # Lists are walked as (list, start) pairs, each standing for a suffix of a list
+        stack = [tree]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, tuple):
+                node, start = node
+                if start < len(node):
+                    stack.append((node, start + 1))
+                    stack.append(node[start])
+                size = len(node) - start
+                if size in self.lists:
+                    heads = self.lists[size]
+                    head_type = type(node[start]) if size else None
+                    self._try(results, heads.get(head_type, ()), node, start)
+                    if head_type is not None:
+                        self._try(results, heads.get(None, ()), node, start)
+            elif isinstance(node, list):
+                stack.append((node, 0))
+            else:
+                self._try(results, self.any, node)
+                if isinstance(node, ast.AST):
+                    self._try(results, self.nodes.get(type(node), ()), node)
+                    stack.extend(reversed([value for _, value in ast.iter_fields(node)]))
+
+        return results
+
+    def _match_index(self, index):
+        results = []
+        for node_type, candidates in self.nodes.items():
+            for node in index.types.get(node_type, ()):
+                self._try(results, candidates, node)
+
+        containers = {}
+        for size, heads in self.lists.items():
+            for head_type, candidates in heads.items():
+                for node in index.types.get(head_type, ()):
+                    container, start = _container(index, node, containers)
+                    if container is not None and len(container) - start == size:
+                        self._try(results, candidates, container, start)
+
+        results.sort(key=lambda r: (getattr(r[1], 'lineno', 0), getattr(r[1], 'col_offset', 0)))
+        return results
+
+    def _try(self, results, candidates, node, start=None):
+        for name, template in candidates:
+            context = {'names': {}, 'rev': {}, 'captures': {}}
+            if start is None:
+                if tree_matches(node, template, context):
+                    results.append((name, node, context['captures']))
+            elif list_matches(node, start, template, context):
+                results.append((name, node[start], context['captures']))
+
+
+def _container(index, node, containers):
+    """
+    Finds a list node is in and its position there.
+
+    Positions of all siblings are remembered in containers on first lookup,
+    so that long statement lists are scanned once, not once per statement.
+    """
+    up = index.parent(node)
+    if up is None:
+        return None, None
+    if up not in containers:
+        containers[up] = {id(item): (value, i)
+                          for _, value in ast.iter_fields(up) if isinstance(value, list)
+                          for i, item in enumerate(value)}
+    return containers[up].get(id(node), (None, None))
+
+
+def tree_matches(node, template, context):
+    if isinstance(template, list):
+        return isinstance(node, list) and list_matches(node, 0, template, context)
+    elif not node_matches(node, template, context):
+        return False
+    elif isinstance(template, ast.AST):
+        return all(tree_matches(value, getattr(template, name), context)
+                   for name, value in ast.iter_fields(node))
+    else:
+        return True
+
+def list_matches(node, start, template, context):
+    return len(node) - start == len(template) \
+        and all(tree_matches(node[start + i], sub, context) for i, sub in enumerate(template))
+
 def node_matches(node, template_node, context):
     if isinstance(template_node, ast.AST):
         return type(node) is type(template_node)
@@ -119,28 +193,9 @@ def node_matches(node, template_node, context):
     else:
         return template_node(node, context)
 
-def get_sub_template(template, path):
-    sub = template
-    for el in path:
-        # TODO: optimize it
-        if el == 0:
-            try:
-                sub = sub[0]
-            except IndexError:
-                return lambda node, _: False
-        elif el == 1:
-            sub = sub[1:]
-        elif isinstance(sub, ast.AST) and el in sub._fields:
-            sub = getattr(sub, el)
-        elif callable(sub):
-            return lambda node, _: True
-        else:
-            raise Exception('Unknown path', path, 'in', astor.dump(sub))
-    return sub
-
 
 def compile_template(func):
-    spec = inspect.getargspec(func)
+    spec = getargspec(func)
     assert len(spec.args) == len(spec.defaults or []), "All template args should have AST classes"
 
     compiler = TemplateCompiler(zipdict(spec.args, spec.defaults or []))
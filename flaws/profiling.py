@@ -0,0 +1,103 @@
+import sys
+import time
+from collections import defaultdict
+from timeit import default_timer
+
+
+cpu_timer = getattr(time, 'process_time', None) or time.clock
+allocated_blocks = getattr(sys, 'getallocatedblocks', lambda: 0)
+
+
+class Profiler(object):
+    """
+    Accumulates wall time, cpu time and allocated blocks delta by phase and wall time by file.
+
+    Phases nest, each one is only accounted its own time, not that of phases inside it,
+    while files get the time of all phases done for them.
+    Does nothing unless enabled.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.stack = []
+        self.phases = defaultdict(lambda: [0, 0, 0, 0])  # name -> [calls, wall, cpu, blocks]
+        self.files = defaultdict(float)
+
+    def enable(self):
+        self.enabled = True
+        self._last = self._now()
+
+    def phase(self, name, filename=None):
+        return _Phase(self, name, filename) if self.enabled else NULL_PHASE
+
+    def _now(self):
+        return default_timer(), cpu_timer(), allocated_blocks()
+
+    def _charge(self):
+        now = self._now()
+        if self.stack:
+            name, filename = self.stack[-1]
+            stats = self.phases[name]
+            wall = now[0] - self._last[0]
+            stats[1] += wall
+            stats[2] += now[1] - self._last[1]
+            stats[3] += now[2] - self._last[2]
+            if filename:
+                self.files[filename] += wall
+        self._last = now
+
+    def push(self, name, filename):
+        self._charge()
+        # Nested phases are accounted to the same file
+        if filename is None and self.stack:
+            filename = self.stack[-1][1]
+        self.phases[name][0] += 1
+        self.stack.append((name, filename))
+
+    def pop(self):
+        self._charge()
+        self.stack.pop()
+
+    def report(self, top=10, out=None):
+        out = out or sys.stderr
+        out.write('%-20s %8s %9s %9s %10s\n' % ('phase', 'calls', 'wall', 'cpu', 'blocks'))
+        for name, (calls, wall, cpu, blocks) in sorted(self.phases.items(),
+                                                      key=lambda item: -item[1][1]):
+            out.write('%-20s %8d %8.3fs %8.3fs %+10d\n' % (name, calls, wall, cpu, blocks))
+        total = [sum(stats[i] for stats in self.phases.values()) for i in range(1, 4)]
+        out.write('%-20s %8s %8.3fs %8.3fs %+10d\n' % tuple(['total', ''] + total))
+
+        if self.files:
+            out.write('\nslowest files:\n')
+            slowest = sorted(self.files.items(), key=lambda item: -item[1])[:top]
+            for filename, wall in slowest:
+                out.write('%8.3fs  %s\n' % (wall, filename))
+
+
+class _Phase(object):
+    __slots__ = ('profiler', 'name', 'filename')
+
+    def __init__(self, profiler, name, filename):
+        self.profiler = profiler
+        self.name = name
+        self.filename = filename
+
+    def __enter__(self):
+        self.profiler.push(self.name, self.filename)
+
+    def __exit__(self, *exc_info):
+        self.profiler.pop()
+
+
+class _NullPhase(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+NULL_PHASE = _NullPhase()
+
+
+profiler = Profiler()
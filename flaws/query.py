@@ -0,0 +1,129 @@
+"""
+Targeted questions about a file set, answered by building scopes only for files involved.
+"""
+import ast
+import re
+
+from funcy.py2 import all
+
+from .asttools import is_use
+from .modules import import_binding
+
+
+def find_uses(files, module, name):
+    """
+    Finds uses of name defined in module, returns a sorted list of (module, node) pairs.
+
+    Files not mentioning name or module are skipped without parsing, others are checked
+    by their summaries and only files importing name get scopes built. Reexports are followed,
+    so uses via `from pkg import f` are found for f defined in pkg.a and imported in pkg.
+    """
+    uses = set()
+    seen = set()
+    sources = {}
+    todo = [(module, name)]
+    while todo:
+        target = todo.pop()
+        if target in seen or target[0] not in files:
+            continue
+        seen.add(target)
+        module, name = target
+
+        for node in _local_uses(files[module].scope, name):
+            uses.add((module, node))
+
+        # `from .a import *` might not mention name, but mentions module
+        words = r'\b(?:%s|%s)\b' % (re.escape(name), re.escape(module.split('.')[-1]))
+        mention = re.compile(words.encode('utf-8'))
+        for package, pyfile in files.items():
+            if package == module:
+                continue
+            if package not in sources:
+                sources[package] = pyfile.read()
+            if not mention.search(sources[package]) or not _imports(files, pyfile, module, name):
+                continue
+            for node, reexport in _file_uses(files, pyfile, module, name):
+                if node is not None:
+                    uses.add((package, node))
+                if reexport:
+                    todo.append((package, reexport))
+
+    return sorted(uses, key=lambda use: (use[0], use[1].lineno, use[1].col_offset))
+
+
+def _imports(files, pyfile, module, name):
+    """
+    Tells whether pyfile might use module.name, judging by its resolved imports.
+    """
+    for _, imported, names, star_uses, uses in files.modules.imports(pyfile):
+        if (module, name) in uses:
+            return True
+        if imported == module:
+            if name in names:
+                return True
+            if '*' in names and (name in star_uses or _exported(pyfile, name)):
+                return True
+    return False
+
+
+def _file_uses(files, pyfile, module, name):
+    """
+    Yields (node, reexported name) pairs for uses of module.name in pyfile.
+    """
+    for scope in pyfile.scope.walk_scopes():
+        for imp in scope.imports:
+            if isinstance(imp, ast.ImportFrom):
+                imported = files.modules.resolve(pyfile, imp.module, imp.level)
+                for alias in imp.names:
+                    bound = alias.asname or alias.name
+                    if alias.name == '*':
+                        # Names bound locally shadow star imported ones
+                        if imported == module and _exported(files[module], name) \
+                                and all(is_use, scope.names.get(name, ())):
+                            for node in _local_uses(scope, name):
+                                yield node, None
+                            if scope.is_module and _exported(pyfile, name):
+                                yield None, name
+                    elif imported == module and alias.name == name:
+                        for node in _local_uses(scope, bound):
+                            yield node, None
+                        if scope.is_module and _exported(pyfile, bound):
+                            yield None, bound
+                    else:
+                        for node in _chain_uses(pyfile.index, scope, bound,
+                                                '%s.%s' % (imported, alias.name), module, name):
+                            yield node, None
+            else:
+                for alias in imp.names:
+                    bound, bound_module = import_binding(alias.name, alias.asname)
+                    for node in _chain_uses(pyfile.index, scope, bound, bound_module,
+                                            module, name):
+                        yield node, None
+
+
+def _local_uses(scope, name):
+    return [node for node in scope.names.get(name, ()) if is_use(node)]
+
+
+def _chain_uses(index, scope, bound, bound_module, module, name):
+    """
+    Finds attribute nodes for module.name referred via a name bound to bound_module.
+    """
+    if module != bound_module and not module.startswith(bound_module + '.'):
+        return
+    chain = module[len(bound_module) + 1:].split('.') if module != bound_module else []
+    chain.append(name)
+    for node in _local_uses(scope, bound):
+        for attr in chain:
+            parent = index.parent(node, ast.Attribute)
+            if parent is not None and parent.attr == attr:
+                node = parent
+            else:
+                break
+        else:
+            yield node
+
+
+def _exported(pyfile, name):
+    exports = pyfile.summary.exports
+    return name in exports if exports is not None else not name.startswith('_')
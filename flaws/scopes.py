@@ -1,10 +1,21 @@
 import ast
+import sys
+from array import array
 from collections import defaultdict, deque
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+try:
+    from sys import intern
+except ImportError:
+    pass
 
-from funcy.py2 import cached_property, any, icat, iterate, takewhile, ikeep, remove
+from funcy.py2 import any, icat, iterate, takewhile, ikeep, remove
 from funcy.py3 import lsplit_by
 
-from .asttools import nodes_str, is_write, is_read, is_param, ast_eval
+from .asttools import nodes_str, is_write, is_read, is_param, ast_eval, COMPREHENSIONS
+from .profiling import profiler
 
 
 # TODO: distinguish python versions
@@ -14,9 +25,78 @@ except ImportError:
     import __builtin__ as builtins
 BUILTINS = set(dir(builtins))
 GLOBALS = BUILTINS | {'__name__', '__file__'}
+EMPTY_SET = frozenset()
+
+
+class NameTable(Mapping):
+    """
+    A compact read-only mapping of names to tuples of nodes.
+
+    Keeps interned names in insertion order, all nodes in a single flat tuple
+    and offsets into it. Larger tables also keep names sorted order for binary search.
+    """
+    __slots__ = ('_names', '_nodes', '_index')
+
+    def __init__(self, names):
+        self._names = tuple(intern(name) for name in names)
+        self._nodes = tuple(icat(names.values()))
+        # Offsets of each name nodes followed by names sorted order
+        self._index = array('I', [0])
+        for nodes in names.values():
+            self._index.append(self._index[-1] + len(nodes))
+        if len(self._names) > 8:
+            self._index.extend(sorted(range(len(self._names)), key=self._names.__getitem__))
+
+    def _find(self, name):
+        size = len(self._names)
+        if size <= 8:
+            for i, other in enumerate(self._names):
+                if other == name:
+                    return i
+            return None
+
+        order = size + 1
+        lo, hi = 0, size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._names[self._index[order + mid]] < name:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < size and self._names[self._index[order + lo]] == name:
+            return self._index[order + lo]
+
+    def _get(self, i):
+        return self._nodes[self._index[i]:self._index[i + 1]]
+
+    def __getitem__(self, name):
+        i = self._find(name)
+        if i is None:
+            raise KeyError(name)
+        return self._get(i)
+
+    def __contains__(self, name):
+        return self._find(name) is not None
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
+
+    def items(self):
+        return [(name, self._get(i)) for i, name in enumerate(self._names)]
+
+    def values(self):
+        return [self._get(i) for i in range(len(self._names))]
+
+EMPTY_TABLE = NameTable({})
 
 
 class Scope(object):
+    __slots__ = ('parent', 'children', 'node', 'names', 'unscoped_names', 'global_names',
+                 'nonlocal_names', 'imports', 'has_stars', 'maybe_from_star', 'future', '_exports')
+
     def __init__(self, parent, node):
         self.parent = parent
         if parent:
@@ -27,6 +107,7 @@ class Scope(object):
         self.names = defaultdict(list)
         self.unscoped_names = defaultdict(list)
         self.global_names = set()
+        self.nonlocal_names = set()
         self.imports = []
         self.has_stars = False
         self.maybe_from_star = defaultdict(list)
@@ -40,20 +121,21 @@ class Scope(object):
         assert self.is_module
 
         for scope in self.walk_scopes():
-            # frozendict would be even better
-            _freeze = lambda d: {name: tuple(nodes) for name, nodes in d.items()}
+            _freeze = lambda d: NameTable(d) if d else EMPTY_TABLE
             scope.names = _freeze(scope.names)
             scope.maybe_from_star = _freeze(scope.maybe_from_star)
 
-            self.imports = tuple(self.imports)
-            self.future = frozenset(self.future)
+            scope.children = tuple(scope.children)
+            scope.imports = tuple(scope.imports)
+            scope.future = frozenset(scope.future) if scope.future else EMPTY_SET
 
             # Clean unscoped names
             assert not scope.unscoped_names
             del scope.unscoped_names
             del scope.global_names
+            del scope.nonlocal_names
 
-    @cached_property
+    @property
     def module(self):
         scope = self
         while not scope.is_module:
@@ -68,13 +150,24 @@ class Scope(object):
     def is_class(self):
         return isinstance(self.node, ast.ClassDef)
 
+    @property
+    def is_comprehension(self):
+        return isinstance(self.node, COMPREHENSIONS)
+
     @property
     def sees_stars(self):
         parents = takewhile(bool, iterate(lambda s: s.parent, self))
         return any(s.has_stars for s in parents)
 
-    @cached_property
+    @property
     def exports(self):
+        try:
+            return self._exports
+        except AttributeError:
+            self._exports = self._get_exports()
+            return self._exports
+
+    def _get_exports(self):
         # There are several possible scenarious:
         #   1. Explicit exports
         #   2. No explicit exports, using _ prefix?
@@ -87,17 +180,23 @@ class Scope(object):
             return None
 
         exports_node = self.names['__all__'][0]
-        assign = exports_node.up
+        assign = self.node.index.parent(exports_node, ast.Assign)
         if not isinstance(assign, ast.Assign) or len(assign.targets) != 1:
-            print("WARN: failed parsing __all__")
             return None
 
         try:
             return ast_eval(assign.value)
         except ValueError:
-            print("WARN: failed parsing __all__")
             return None
 
+    @property
+    def bad_exports(self):
+        """
+        The __all__ node if it's present but failed to parse.
+        """
+        if self.is_module and '__all__' in self.names and self.exports is None:
+            return self.names['__all__'][0]
+
     @property
     def implicit_exports(self):
         assert self.is_module
@@ -118,16 +217,26 @@ class Scope(object):
     def make_global(self, names):
         self.global_names.update(names)
 
-    def resolve(self):
+    def make_nonlocal(self, names):
+        self.nonlocal_names.update(names)
+
+    def resolve(self, pending):
+        """
+        Detects local names, then resolves names left unscoped here and in subscopes.
+
+        Pending is {name: [(scope, nodes), ...]} of names unresolved in subscopes, in tree order.
+        Returns the same for names still unresolved, these are to be passed to parent scope.
+        This way each unresolved name goes up once instead of rescanning whole subtree.
+        """
         # Extract global names to module scope
         for name in self.global_names:
             nodes = self.unscoped_names.pop(name, [])
             self.module.names[name].extend(nodes)
 
-        # TODO: add nonlocal support here
-
-        # Detect local names
+        # Detect local names, nonlocal ones are left for enclosing scopes to claim
         for name, nodes in list(self.unscoped_names.items()):
+            if name in self.nonlocal_names:
+                continue
             # Class scope special semantics: reads before first write go out
             if self.is_class:
                 starting_reads, rest = lsplit_by(is_read, nodes)
@@ -141,39 +250,44 @@ class Scope(object):
                 self.names[name].extend(nodes)
                 self.unscoped_names.pop(name)
 
-        # Resolve nested
-        if not self.is_class:
-            for scope in self.walk_scopes():
-                self._resolve_unscoped(scope)
+        # Own names go before nested ones
+        for name, nodes in self.unscoped_names.items():
+            pending[name] = [(self, nodes)] + pending.get(name, [])
 
-    def _resolve_unscoped(self, from_scope):
-        for name, nodes in list(from_scope.unscoped_names.items()):
+        # Class scope is not visible from nested ones
+        if self.is_class or not pending:
+            return pending
+
+        for name, entries in list(pending.items()):
             # NOTE: star import in nested scope may break a chain,
             #       no way to know locally
             if self.has_stars:
-                self.maybe_from_star[name] = nodes
+                self.maybe_from_star[name] = entries[-1][1]
 
             # If name is known or known global then own it
             if name in self.names or self.is_global(name):
-                self.names[name].extend(nodes)
-                from_scope.unscoped_names.pop(name)
+                for scope, nodes in entries:
+                    self.names[name].extend(nodes)
+                    del scope.unscoped_names[name]
+                del pending[name]
             # If reached top level leave all unscoped inplace
             elif self.is_module:
-                from_scope.names[name].extend(nodes)
-                from_scope.unscoped_names.pop(name)
+                for scope, nodes in entries:
+                    scope.names[name].extend(nodes)
+                    del scope.unscoped_names[name]
+                del pending[name]
+        return pending
 
     def walk_scopes(self):
-        yield self
-        for child in self.children:
-            for scope in child.walk_scopes():
-                yield scope
+        stack = [self]
+        while stack:
+            scope = stack.pop()
+            yield scope
+            stack.extend(reversed(scope.children))
 
     def walk(self):
-        for name, nodes in self.names.items():
-            yield self, name, nodes
-
-        for child in self.children:
-            for scope, name, nodes in child.walk():
+        for scope in self.walk_scopes():
+            for name, nodes in scope.names.items():
                 yield scope, name, nodes
 
     def is_global(self, name):
@@ -204,26 +318,91 @@ class Scope(object):
 
 
 
-class TreeLinker(ast.NodeVisitor):
+class NodeIndex(object):
+    """
+    Tree nodes by type and calls by function name or attribute, both in tree order.
+
+    Parents are kept here too, not linked from nodes, so that trees have no reference cycles
+    for garbage collector to chase. These are only looked up at a few places,
+    so parent tables are built on first use.
+    """
     def __init__(self):
-        self.stack = deque()
+        self.types = defaultdict(list)
+        self.calls = defaultdict(list)
+        self._parents = {}
+
+    def add(self, node):
+        self.types[node.__class__].append(node)
+        if isinstance(node, ast.Call):
+            func = node.func
+            if isinstance(func, ast.Name):
+                self.calls[func.id].append(node)
+            elif isinstance(func, ast.Attribute):
+                self.calls[func.attr].append(node)
+
+    def nodes(self, cls):
+        """
+        Iterates over all nodes of cls or its subclasses.
+        """
+        return icat(nodes for t, nodes in self.types.items() if issubclass(t, cls))
+
+    def parent(self, node, cls=ast.AST):
+        """
+        Returns a node this one is a child of if it's a cls instance, None otherwise.
+        Passing a narrower cls is faster and keeps a smaller table.
+        """
+        parents = self._parents.get(cls)
+        if parents is None:
+            parents = self._parents[cls] = {child: parent for parent in self.nodes(cls)
+                                            for child in _child_nodes(parent)}
+        return parents.get(node)
 
-    def visit(self, node):
-        if self.stack:
-            node.up = self.stack[-1]
-        self.stack.append(node)
-        self.generic_visit(node)
-        self.stack.pop()
+
+class TreeLinker(object):
+    """
+    Indexes nodes into tree.index.
+
+    Walks with an explicit stack, so that deep expressions don't hit recursion limit.
+    """
+    def __init__(self):
+        self.index = NodeIndex()
+
+    def visit(self, tree):
+        tree.index = self.index
+        add = self.index.add
+        stack = [tree]
+        while stack:
+            node = stack.pop()
+            add(node)
+            children = _child_nodes(node)
+            children.reverse()
+            stack.extend(children)
 
 
 class ScopeBuilder(ast.NodeVisitor):
     def __init__(self):
         self.scopes = deque()
+        self.pending = deque()
 
     def visit_all(self, *node_lists):
         for node in icat(node_lists):
             self.visit(node)
 
+    def generic_visit(self, node):
+        # Only nodes with own visitors recurse, which keeps depth to scope nesting
+        # rather than expression nesting
+        stack = _child_nodes(node)
+        stack.reverse()
+        while stack:
+            node = stack.pop()
+            visitor = getattr(self, 'visit_' + node.__class__.__name__, None)
+            if visitor:
+                visitor(node)
+            else:
+                children = _child_nodes(node)
+                children.reverse()
+                stack.extend(children)
+
     # Scope mechanics
     @property
     def scope(self):
@@ -235,10 +414,24 @@ class ScopeBuilder(ast.NodeVisitor):
     def push_scope(self, node):
         node.scope = Scope(self.scope, node)
         self.scopes.append(node.scope)
+        # Created lazily, most scopes resolve everything in them
+        self.pending.append(None)
 
     def pop_scope(self):
-        self.scope.resolve()
+        with profiler.phase('resolve'):
+            pending = self.scope.resolve(self.pending.pop() or {})
         self.scopes.pop()
+        # Pass names unresolved here to parent scope
+        if pending and self.pending:
+            parent_pending = self.pending[-1]
+            if parent_pending is None:
+                self.pending[-1] = pending
+            else:
+                for name, entries in pending.items():
+                    if name in parent_pending:
+                        parent_pending[name].extend(entries)
+                    else:
+                        parent_pending[name] = entries
 
     # Visiting
     def visit_Module(self, node):
@@ -265,8 +458,7 @@ class ScopeBuilder(ast.NodeVisitor):
 
     def visit_ClassDef(self, node):
         self.scope.add(node.name, node)
-        # TODO: handle python 3 style metaclass
-        self.visit_all(node.decorator_list, node.bases)
+        self.visit_all(node.decorator_list, node.bases, getattr(node, 'keywords', []))
 
         self.push_scope(node)
         self.visit_all(node.body)
@@ -275,27 +467,37 @@ class ScopeBuilder(ast.NodeVisitor):
     def visit_FunctionDef(self, node):
         self.scope.add(node.name, node)
         self.visit_all(node.decorator_list)
-        self.visit_all(node.args.defaults, getattr(node.args, 'kw_defaults', []))
+        self.visit_defaults(node.args)
+        # Annotations are evaluated in enclosing scope
+        self.visit_all(ikeep(getattr(arg, 'annotation', None) for arg in _all_args(node.args)))
+        if getattr(node, 'returns', None):
+            self.visit(node.returns)
 
         self.push_scope(node)
         self.visit(node.args)
         self.visit_all(node.body)
         self.pop_scope()
 
+    visit_AsyncFunctionDef = visit_FunctionDef
+
     def visit_Lambda(self, node):
-        self.visit_all(node.args.defaults, getattr(node.args, 'kw_defaults', []))
+        self.visit_defaults(node.args)
 
         self.push_scope(node)
         self.visit(node.args)
         self.visit(node.body)
         self.pop_scope()
 
+    def visit_defaults(self, node):
+        # kw_defaults has None for keyword only args without defaults
+        self.visit_all(node.defaults, ikeep(getattr(node, 'kw_defaults', [])))
+
     def visit_arguments(self, node):
-        self.visit_all(node.args)
+        self.visit_all(getattr(node, 'posonlyargs', []), node.args)
         # NOTE: arguments node doesn't have lineno and col_offset,
-        #       so we copy them from a function node
-        node.lineno = node.up.lineno
-        node.col_offset = node.up.col_offset
+        #       so we copy them from a function node, whose scope we are in
+        node.lineno = self.scope.node.lineno
+        node.col_offset = self.scope.node.col_offset
 
         # In Python 2 these are just strings
         for a in (node.vararg, node.kwarg):
@@ -310,6 +512,54 @@ class ScopeBuilder(ast.NodeVisitor):
     def visit_arg(self, node):
         self.scope.add(node.arg, node)
 
+    def visit_comprehension_scope(self, node):
+        # The first iterable is evaluated in enclosing scope, all the rest in its own one
+        generators = node.generators
+        self.visit(generators[0].iter)
+
+        self.push_scope(node)
+        for i, comp in enumerate(generators):
+            self.visit(comp.target)
+            if i:
+                self.visit(comp.iter)
+            self.visit_all(comp.ifs)
+        if isinstance(node, ast.DictComp):
+            self.visit_all([node.key, node.value])
+        else:
+            self.visit(node.elt)
+        self.pop_scope()
+
+    visit_GeneratorExp = visit_SetComp = visit_DictComp = visit_comprehension_scope
+    if sys.version_info[0] >= 3:
+        visit_ListComp = visit_comprehension_scope
+
+    def visit_NamedExpr(self, node):
+        self.visit(node.value)
+        # Binds a name in the nearest scope not being a comprehension
+        scope = next(s for s in reversed(self.scopes) if not s.is_comprehension)
+        scope.add(node.target.id, node.target)
+
+    def visit_AnnAssign(self, node):
+        if node.value:
+            self.visit(node.value)
+        self.visit(node.annotation)
+        self.visit(node.target)
+
+    def visit_MatchAs(self, node):
+        if node.pattern:
+            self.visit(node.pattern)
+        if node.name:
+            self.scope.add(node.name, node)
+
+    def visit_MatchStar(self, node):
+        if node.name:
+            self.scope.add(node.name, node)
+
+    def visit_MatchMapping(self, node):
+        self.visit_all(node.keys, node.patterns)
+        if node.rest:
+            self.scope.add(node.rest, node)
+
     def visit_Name(self, node):
         # TODO: respect assignments to these or make it a separate error
         self.scope.add(node.id, node)
@@ -317,13 +567,17 @@ class ScopeBuilder(ast.NodeVisitor):
     def visit_Global(self, node):
         self.scope.make_global(node.names)
 
+    def visit_Nonlocal(self, node):
+        self.scope.make_nonlocal(node.names)
+
     def visit_Assign(self, node):
         # Visit expression first to get outer reads in class scope
         self.visit(node.value)
         self.visit_all(node.targets)
 
     def visit_ExceptHandler(self, node):
-        self.visit(node.type)
+        if node.type:
+            self.visit(node.type)
         # In Python 3 this is not wrapped
         if isinstance(node.name, str):
             self.scope.add(node.name, node)
@@ -332,7 +586,28 @@ class ScopeBuilder(ast.NodeVisitor):
         self.visit_all(node.body)
 
 
+def _child_nodes(node):
+    """
+    Same as list(ast.iter_child_nodes(node)), only faster.
+    """
+    children = []
+    for field in node._fields:
+        value = getattr(node, field, None)
+        if isinstance(value, ast.AST):
+            children.append(value)
+        elif isinstance(value, list):
+            children.extend(item for item in value if isinstance(item, ast.AST))
+    return children
+
+def _all_args(node):
+    args = getattr(node, 'posonlyargs', []) + node.args + getattr(node, 'kwonlyargs', [])
+    return args + [a for a in (node.vararg, node.kwarg) if a is not None]
+
+
 def fill_scopes(tree):
     TreeLinker().visit(tree)
+    build_scopes(tree)
+
+def build_scopes(tree):
     ScopeBuilder().visit(tree)
     tree.scope.freeze()
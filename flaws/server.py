@@ -0,0 +1,225 @@
+"""
+A language server publishing flaws as diagnostics, speaks LSP over stdio.
+
+Keeps files with their trees, scopes and global usage index in memory between changes.
+Open documents are analyzed from editor buffers, not from disk.
+"""
+import asyncio
+import json
+import os
+import sys
+from urllib.parse import unquote, urlparse
+from urllib.request import pathname2url
+
+from funcy import distinct, partial
+
+from .analysis import local_flaws, isolate
+from .watch import Watcher
+
+
+# Wait for this many seconds of quiet before analyzing
+DELAY = 0.3
+
+# LSP constants
+FULL_SYNC = 1
+WARNING = 2
+METHOD_NOT_FOUND = -32601
+
+
+class Server(Watcher):
+    def __init__(self, roots, make_files, out=None, delay=DELAY):
+        self.buffers = {}  # real path -> source bytes
+        Watcher.__init__(self, roots, None)
+        self.make_files = lambda: make_files(self.roots, sources=self.buffers)
+        self.out = out or getattr(sys.stdout, 'buffer', sys.stdout)
+        self.delay = delay
+        self.task = None
+        self.local = {}      # package -> local diagnostics
+        self.pending = set() # packages changed, but not yet checked locally
+        self.stale = False   # global pass not yet redone after a change
+        self.published = {}  # filename -> package
+        self.running = True
+
+    # Protocol
+
+    async def serve(self, reader):
+        while self.running:
+            message = await read_message(reader)
+            if message is None:
+                break
+            self.handle(message)
+        if self.task:
+            self.task.cancel()
+
+    def handle(self, message):
+        method, params = message.get('method'), message.get('params') or {}
+        handler = getattr(self, 'on_' + (method or '').replace('/', '_'), None)
+        if 'id' not in message:
+            if handler:
+                handler(params)
+        elif handler:
+            self.send({'jsonrpc': '2.0', 'id': message['id'], 'result': handler(params)})
+        else:
+            error = {'code': METHOD_NOT_FOUND, 'message': 'Unknown method %s' % method}
+            self.send({'jsonrpc': '2.0', 'id': message['id'], 'error': error})
+
+    def send(self, message):
+        body = json.dumps(message).encode('utf-8')
+        self.out.write(b'Content-Length: %d\r\n\r\n' % len(body) + body)
+        self.out.flush()
+
+    def notify(self, method, params):
+        self.send({'jsonrpc': '2.0', 'method': method, 'params': params})
+
+    # Requests and notifications
+
+    def on_initialize(self, params):
+        if not self.roots and params.get('rootUri'):
+            self.roots = [uri_to_path(params['rootUri'])]
+        return {'capabilities': {
+            'textDocumentSync': {'openClose': True, 'change': FULL_SYNC, 'save': True},
+        }}
+
+    def on_initialized(self, params):
+        self.schedule()
+
+    def on_shutdown(self, params):
+        return None
+
+    def on_exit(self, params):
+        self.running = False
+
+    def on_textDocument_didOpen(self, params):
+        self._set_buffer(params['textDocument']['uri'], params['textDocument']['text'])
+
+    def on_textDocument_didChange(self, params):
+        # Full sync, so the last change holds the whole text
+        self._set_buffer(params['textDocument']['uri'], params['contentChanges'][-1]['text'])
+
+    def on_textDocument_didClose(self, params):
+        self.buffers.pop(os.path.realpath(uri_to_path(params['textDocument']['uri'])), None)
+        self.schedule()
+
+    def on_textDocument_didSave(self, params):
+        self.schedule()
+
+    def on_workspace_didChangeWatchedFiles(self, params):
+        self.schedule()
+
+    def _set_buffer(self, uri, text):
+        self.buffers[os.path.realpath(uri_to_path(uri))] = text.encode('utf-8')
+        self.schedule()
+
+    # Analysis
+
+    def schedule(self):
+        """
+        Starts analysis after a delay, cancelling one already running or waiting.
+        """
+        if self.task and not self.task.done():
+            self.task.cancel()
+        self.task = asyncio.ensure_future(self.analyze())
+
+    async def analyze(self):
+        await asyncio.sleep(self.delay)
+
+        # Remember changes till they are checked, in case we are cancelled before that
+        changed = self.reload()
+        if changed is not None:
+            self.pending |= changed
+            self.stale = True
+        if not self.stale:
+            return
+        files = self.files
+        self.pending &= set(files)
+        for package in sorted(self.pending):
+            self.local[package] = isolate(local_flaws, files[package])
+            self.pending.discard(package)
+            self.publish(package)
+            await asyncio.sleep(0)
+
+        for pyfile in files.values():
+            if 'summary' not in pyfile.__dict__:
+                pyfile.summary
+                await asyncio.sleep(0)
+        affected = self.index.update(files)
+        self.index.save(files)
+
+        for error in self.index.plugin_errors:
+            self.notify('window/logMessage', {'type': WARNING, 'message': str(error)})
+        for package in sorted(affected & set(files)):
+            self.publish(package)
+
+        # Clear diagnostics of files gone
+        for filename, package in list(self.published.items()):
+            if package not in files or files[package].filename != filename:
+                self.local.pop(package, None)
+                self.notify('textDocument/publishDiagnostics',
+                            {'uri': path_to_uri(filename), 'diagnostics': []})
+                del self.published[filename]
+        self.stale = False
+
+    def publish(self, package):
+        pyfile = self.files[package]
+        # Files errors are reported both locally and globally
+        diagnostics = distinct(self.local.get(package, [])
+                               + self.index.warnings.get(package, [])
+                               + self.index.verdicts.get(package, []))
+        self.notify('textDocument/publishDiagnostics', {
+            'uri': path_to_uri(pyfile.filename),
+            'diagnostics': [lsp_diagnostic(diag) for diag in diagnostics],
+        })
+        self.published[pyfile.filename] = package
+
+
+def lsp_diagnostic(diag):
+    position = {'line': diag.line - 1, 'character': diag.col or 0}
+    return {
+        'range': {'start': position, 'end': position},
+        'severity': WARNING,
+        'code': diag.code,
+        'source': 'flaws',
+        'message': diag.message,
+    }
+
+
+async def read_message(reader):
+    """
+    Reads a JSON-RPC message with LSP base protocol headers, returns None on EOF.
+    """
+    length = None
+    while True:
+        line = await reader.readline()
+        if not line:
+            return None
+        line = line.strip()
+        if not line:
+            break
+        name, _, value = line.partition(b':')
+        if name.lower() == b'content-length':
+            length = int(value)
+    if length is None:
+        return None
+    return json.loads((await reader.readexactly(length)).decode('utf-8'))
+
+
+def uri_to_path(uri):
+    return unquote(urlparse(uri).path)
+
+def path_to_uri(path):
+    return 'file://' + pathname2url(os.path.abspath(path))
+
+
+def serve(roots, make_files):
+    """
+    Runs a language server over stdin and stdout until exit notification or EOF.
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        reader = asyncio.StreamReader()
+        loop.run_until_complete(loop.connect_read_pipe(
+            partial(asyncio.StreamReaderProtocol, reader), sys.stdin))
+        loop.run_until_complete(Server(roots, make_files).serve(reader))
+    finally:
+        loop.close()
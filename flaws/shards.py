@@ -0,0 +1,88 @@
+"""
+Splits global analysis over several processes or machines.
+
+Each shard summarizes its part of files and writes summaries to a file,
+then merge loads all of them into a single file set to run the global pass over.
+Summaries carry everything that pass needs, including which names are used locally.
+"""
+import zlib
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from . import __version__
+from .analysis import FileSet, File
+from .cache import FORMAT
+from .utils import atomic_write
+
+
+def parse_shard(spec):
+    """
+    Parses "i/N" into (i, N), shards are numbered from 1.
+    """
+    try:
+        i, n = map(int, spec.split('/'))
+    except ValueError:
+        raise ValueError('Bad shard %r, should look like 1/4' % spec)
+    if not 1 <= i <= n:
+        raise ValueError('Bad shard %r, should be from 1/%d to %d/%d' % (spec, n, n, n))
+    return i, n
+
+
+def select_shard(files, i, n):
+    """
+    Leaves only files of shard i out of n in a file set.
+
+    Files are spread by a hash of their package, so that shards are the same on any machine.
+    """
+    for package in list(files):
+        if zlib.crc32(package.encode('utf-8')) % n != i - 1:
+            del files[package]
+
+
+def write_shard(files, shard, path, jobs=None):
+    """
+    Summarizes files and writes them to path as a shard to be merged later.
+    """
+    files.summarize(jobs)
+    data = {
+        'version': (__version__, FORMAT),
+        'shard': shard,
+        'files': [(pyfile.base, pyfile.filename, pyfile.is_entry, pyfile.summary)
+                  for _, pyfile in sorted(files.items())],
+    }
+    atomic_write(path, pickle.dumps(data, pickle.HIGHEST_PROTOCOL), suffix='.shard')
+
+
+def load_shards(paths):
+    """
+    Loads shards into a file set with summaries, checking all of them are present.
+
+    Trees are still read from files if asked for, e.g. by plugins,
+    so merge should be run in the same checkout.
+    """
+    files = FileSet([])
+    seen = set()
+    count = None
+    for path in paths:
+        with open(path, 'rb') as f:
+            data = pickle.load(f)
+        if data.get('version') != (__version__, FORMAT):
+            raise ValueError('Shard %s is written by another flaws version' % path)
+        i, n = data['shard']
+        if count is not None and n != count:
+            raise ValueError('Shard %s is %d/%d, while others are out of %d' % (path, i, n, count))
+        count = n
+        seen.add(i)
+
+        for base, filename, is_entry, summary in data['files']:
+            pyfile = File(base, filename, is_entry)
+            pyfile.summary = summary
+            files[pyfile.package] = pyfile
+
+    missing = set(range(1, (count or 0) + 1)) - seen
+    if missing:
+        raise ValueError('Missing shards %s out of %d'
+                         % (', '.join(map(str, sorted(missing))), count))
+    return files
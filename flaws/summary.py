@@ -0,0 +1,93 @@
+import ast
+
+from funcy.py2 import any, ikeep, imapcat, partial, remove
+
+from .asttools import is_use, name_class, ast_eval, is_str, literal_value, FUNCTION_DEFS
+
+
+class Summary(object):
+    """
+    A compact picklable digest of a module scope.
+
+    Holds everything the global pass and plugins need,
+    so it could be built in another process and the tree dropped.
+    """
+    def __init__(self, scope, errors=()):
+        self.errors = errors  # (lineno, col, code, message)
+        # name -> (lineno, name class, used locally)
+        self.names = {name: (nodes[0].lineno, name_class(nodes[0]), any(is_use, nodes))
+                      for name, nodes in scope.names.items()}
+        self.future = set(scope.future)
+        self.exports = scope.exports
+        self.bad_exports = scope.bad_exports and scope.bad_exports.lineno
+        index = scope.node.index
+        self.imports = [_import_info(index, s, node)
+                        for s in scope.walk_scopes() for node in s.imports]
+
+        # Facts about module level assignments, used by plugins
+        self.assigns = {}
+        self.values = {}
+        self.decorators = {}
+        for name, nodes in scope.names.items():
+            node = nodes[0]
+            if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
+                assign = index.parent(node, ast.Assign)
+                self.assigns[name] = tuple(_strings(assign.value)) if assign else ()
+                if assign and len(assign.targets) == 1:
+                    try:
+                        self.values[name] = ast_eval(assign.value)
+                    except ValueError:
+                        pass
+            elif isinstance(node, FUNCTION_DEFS + (ast.ClassDef,)):
+                self.decorators[name] = set(ikeep(_decorator_name,
+                                                  imapcat(ast.walk, node.decorator_list)))
+
+    @property
+    def implicit_exports(self):
+        return remove(r'^_', self.names)
+
+
+def _import_info(index, scope, node):
+    """
+    Returns (lineno, is_from, module, level, aliases, star_uses),
+    each alias is (name, asname, chains) with chains being attribute lookups made on a bound name.
+    """
+    is_from = isinstance(node, ast.ImportFrom)
+    aliases = []
+    for alias in node.names:
+        name = alias.asname or alias.name
+        if name == '*':
+            chains = ()
+        else:
+            bound = name if is_from else name.split('.')[0]
+            chains = set(ikeep(partial(attr_chain, index), scope.names.get(bound, ())))
+        aliases.append((alias.name, alias.asname, chains))
+
+    star_uses = None
+    if is_from and any(alias.name == '*' for alias in node.names):
+        star_uses = {name for name, nodes in scope.maybe_from_star.items() if any(is_use, nodes)}
+
+    return (node.lineno, is_from, getattr(node, 'module', None), getattr(node, 'level', 0),
+            aliases, star_uses)
+
+
+def attr_chain(index, node):
+    """
+    Returns a tuple of attributes subsequently looked up on a node, e.g. ('b', 'c') for a.b.c
+    """
+    chain = []
+    parent = index.parent(node, ast.Attribute)
+    while parent is not None:
+        chain.append(parent.attr)
+        parent = index.parent(parent, ast.Attribute)
+    return tuple(chain)
+
+
+def _strings(node):
+    return (literal_value(n) for n in ast.walk(node) if is_str(n))
+
+def _decorator_name(node):
+    if isinstance(node, ast.Name):
+        return node.id
+    elif isinstance(node, ast.Attribute):
+        return node.attr
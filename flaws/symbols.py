@@ -0,0 +1,161 @@
+"""
+Writes a symbol table of a file set to SQLite for other tools to query.
+
+Query "who uses pkg.a.f" with:
+
+    SELECT user FROM module_uses WHERE module = 'pkg.a' AND name = 'f'
+"""
+import ast
+import sqlite3
+import sys
+from collections import defaultdict
+
+from funcy.py2 import partial
+
+from . import __version__
+from .analysis import file_usage
+from .asttools import is_write, name_class, FUNCTION_DEFS, COMPREHENSIONS
+from .ext import run_global_usage
+from .utils import atomic_write
+
+
+# Bump this on any incompatible changes to schema
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE modules (
+    id INTEGER PRIMARY KEY, name TEXT UNIQUE, filename TEXT, is_entry INTEGER
+);
+CREATE TABLE exports (module_id INTEGER, name TEXT);
+CREATE TABLE scopes (
+    id INTEGER PRIMARY KEY, module_id INTEGER, parent_id INTEGER,
+    kind TEXT, name TEXT, lineno INTEGER
+);
+CREATE TABLE names (
+    id INTEGER PRIMARY KEY, scope_id INTEGER, name TEXT,
+    kind TEXT, lineno INTEGER, col INTEGER
+);
+CREATE TABLE refs (name_id INTEGER, lineno INTEGER, col INTEGER, is_write INTEGER);
+CREATE TABLE imports (
+    module_id INTEGER, lineno INTEGER, imported TEXT, name TEXT, asname TEXT
+);
+CREATE TABLE uses (module_id INTEGER, name TEXT, user_id INTEGER);
+
+CREATE INDEX names_name ON names (name);
+CREATE INDEX refs_name_id ON refs (name_id);
+CREATE INDEX imports_imported ON imports (imported, name);
+CREATE INDEX uses_module_name ON uses (module_id, name);
+
+-- Uses by other modules, user is NULL when something is used by a plugin, e.g. django
+CREATE VIEW module_uses AS
+    SELECT m.name AS module, uses.name AS name, u.name AS user
+    FROM uses JOIN modules m ON m.id = uses.module_id
+    LEFT JOIN modules u ON u.id = uses.user_id;
+"""
+
+SCOPE_KINDS = {ast.Module: 'module', ast.ClassDef: 'class', ast.Lambda: 'lambda'}
+SCOPE_KINDS.update({cls: 'function' for cls in FUNCTION_DEFS})
+SCOPE_KINDS.update({cls: 'comprehension' for cls in COMPREHENSIONS})
+
+
+def write_symbols(files, path, jobs=None):
+    """
+    Writes modules, scopes, names, their references, imports, exports
+    and global uses of all files to an SQLite database at path.
+    """
+    atomic_write(path, partial(_write_db, files, jobs), suffix='.db')
+
+
+def _write_db(files, jobs, filename):
+    db = sqlite3.connect(filename)
+    try:
+        _fill(db, files, jobs)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _fill(db, files, jobs):
+    db.executescript(SCHEMA)
+    db.execute('PRAGMA user_version = %d' % SCHEMA_VERSION)
+    db.executemany('INSERT INTO meta VALUES (?, ?)', [
+        ('schema_version', str(SCHEMA_VERSION)),
+        ('flaws_version', __version__),
+        ('python_version', sys.version.split()[0]),
+    ])
+
+    module_ids = {package: i for i, package in enumerate(sorted(files), 1)}
+    db.executemany('INSERT INTO modules VALUES (?, ?, ?, ?)', [
+        (module_ids[package], package, pyfile.filename, pyfile.is_entry)
+        for package, pyfile in files.items()
+    ])
+
+    scope_id = name_id = 0
+    for package, (summary, (scopes, names, refs)) in files.map(_file_symbols, jobs):
+        files[package].summary = summary
+        module_id = module_ids[package]
+        db.executemany('INSERT INTO scopes VALUES (?, ?, ?, ?, ?, ?)', [
+            (scope_id + i, module_id, parent and scope_id + parent, kind, name, lineno)
+            for i, parent, kind, name, lineno in scopes
+        ])
+        db.executemany('INSERT INTO names VALUES (?, ?, ?, ?, ?, ?)', [
+            (name_id + i, scope_id + scope, name, kind, lineno, col)
+            for i, scope, name, kind, lineno, col in names
+        ])
+        db.executemany('INSERT INTO refs VALUES (?, ?, ?, ?)', [
+            (name_id + i, lineno, col, is_write) for i, lineno, col, is_write in refs
+        ])
+        scope_id += len(scopes)
+        name_id += len(names)
+
+    uses = []
+    for package, pyfile in sorted(files.items()):
+        module_id = module_ids[package]
+        db.executemany('INSERT INTO exports VALUES (?, ?)',
+                       [(module_id, name) for name in pyfile.summary.exports or ()])
+        db.executemany('INSERT INTO imports VALUES (?, ?, ?, ?, ?)',
+                       list(_import_rows(module_id, pyfile, files)))
+
+        used, _, _ = file_usage(pyfile, files)
+        uses.extend((module_ids[module], name, module_id)
+                    for module, names in used.items() if module != package and module in module_ids
+                    for name in names)
+
+    plugin_used = defaultdict(set)
+    run_global_usage(files, plugin_used)
+    uses.extend((module_ids[module], name, None)
+                for module, names in plugin_used.items() if module in module_ids
+                for name in names)
+    db.executemany('INSERT INTO uses VALUES (?, ?, ?)', uses)
+
+
+def _file_symbols(pyfile):
+    """
+    Returns summary and (scopes, names, refs) rows of a file with ids local to it.
+    """
+    scopes, names, refs = [], [], []
+    scope_ids = {}
+    for scope in pyfile.scope.walk_scopes():
+        scope_ids[scope] = i = len(scopes) + 1
+        scopes.append((i, scope_ids.get(scope.parent), SCOPE_KINDS.get(type(scope.node)),
+                       getattr(scope.node, 'name', None), getattr(scope.node, 'lineno', None)))
+        for name, nodes in sorted(scope.names.items()):
+            j = len(names) + 1
+            node = nodes[0]
+            names.append((j, i, name, name_class(node),
+                          getattr(node, 'lineno', None), getattr(node, 'col_offset', None)))
+            refs.extend((j, getattr(n, 'lineno', None), getattr(n, 'col_offset', None),
+                         is_write(n)) for n in nodes)
+    return pyfile.summary, (scopes, names, refs)
+
+
+def _import_rows(module_id, pyfile, files):
+    for lineno, is_from, module, level, aliases, _ in pyfile.summary.imports:
+        if is_from:
+            module = files.modules.resolve(pyfile, module, level)
+            for name, asname, _ in aliases:
+                yield module_id, lineno, module, name, asname
+        else:
+            for name, asname, _ in aliases:
+                yield module_id, lineno, name, None, asname
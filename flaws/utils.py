@@ -1,3 +1,99 @@
+import gc
+import mmap
+import os
+import sys
+import tempfile
+
+
+# Files larger than this are memory-mapped instead of read
+MMAP_SIZE = 1 << 20
+
+# Objects allocated in bulk mode between young generation collections
+BULK_GC_THRESHOLD = 100000
+
+
 def slurp(filename):
-    with open(filename) as f:
-        return f.read()
+    """
+    Reads file as bytes, leaving decoding to a consumer, e.g. ast.parse() honors coding cookies.
+    Large files are memory-mapped, returning a read-only bytes-like object.
+    """
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < MMAP_SIZE:
+            return f.read()
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def atomic_write(path, data, suffix=''):
+    """
+    Writes data to a temporary file and moves it to path, so that it's never seen half written.
+    Data is either bytes or a function writing to a given filename.
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=suffix)
+    try:
+        if callable(data):
+            os.close(fd)
+            data(tmp)
+        else:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+        os.rename(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def progress(iterable=None, total=None):
+    """
+    Shows a progress bar on a terminal, does nothing when output is piped or captured,
+    only importing tqdm in the former case.
+    """
+    if sys.stderr.isatty():
+        from tqdm import tqdm
+        return tqdm(iterable, total=total, leave=False)
+    return NoProgress(iterable)
+
+
+class NoProgress(object):
+    def __init__(self, iterable=None):
+        self.iterable = iterable
+
+    def __iter__(self):
+        return iter(self.iterable)
+
+    def update(self, n=1):
+        pass
+
+    def close(self):
+        pass
+
+
+class BulkGC(object):
+    """
+    Defers garbage collection while analyzing many files, call .step() after each one.
+
+    Automatic collections would walk trees built so far again and again, while these
+    are either kept till the end or released as a whole. So young generation is only
+    collected once in a while, between files, and survivors are frozen, not to be looked
+    at again. On exit they are moved to the oldest generation and collection is reenabled.
+    """
+    def __init__(self, threshold=BULK_GC_THRESHOLD):
+        self.threshold = threshold
+
+    def __enter__(self):
+        self.enabled = gc.isenabled()
+        gc.disable()
+        return self
+
+    def step(self):
+        if self.enabled and gc.get_count()[0] > self.threshold:
+            gc.collect(0)
+            # Not available before Python 3.7, survivors are just left in middle generation
+            if hasattr(gc, 'freeze'):
+                gc.freeze()
+
+    def __exit__(self, *exc_info):
+        if self.enabled:
+            if hasattr(gc, 'unfreeze'):
+                gc.unfreeze()
+            gc.enable()
@@ -0,0 +1,106 @@
+import os
+import time
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
+
+from funcy.py2 import icat
+
+from .analysis import UsageIndex, local_flaws, isolate
+from .diagnostics import text_sink
+
+
+class Watcher(object):
+    """
+    Keeps files with their trees and scopes in memory,
+    reanalyzes modified ones on change and prints affected flaws.
+    Uses inotify if inotify_simple is installed, polls mtimes otherwise.
+    """
+    def __init__(self, roots, make_files, sink=text_sink, interval=1):
+        self.roots = roots
+        self.make_files = make_files
+        self.sink = sink
+        self.interval = interval
+        self.files = {}
+        self.stats = {}
+        self.index = None
+        self.inotify = None
+
+    def run(self):
+        while True:
+            self.refresh()
+            self.wait()
+
+    def refresh(self):
+        changed = self.reload()
+        if changed is None:
+            return
+
+        files = self.files
+        files.summarize()
+        affected = self.index.update(files)
+        self.index.save(files)
+
+        self.sink(icat(
+            [self.index.plugin_errors]
+            + [isolate(local_flaws, files[package]) for package in sorted(changed)]
+            + [self.index.warnings[package] + self.index.verdicts[package]
+               for package in sorted(affected & set(files))]
+        ))
+
+    def reload(self):
+        """
+        Rebuilds file set keeping files not modified since last time along with their trees
+        and scopes. Returns a set of changed packages or None if nothing changed at all.
+        """
+        files = self.make_files()
+        stats = {package: (_stat(pyfile.filename), pyfile.source)
+                 for package, pyfile in files.items()}
+
+        changed = set()
+        for package, pyfile in files.items():
+            old = self.files.get(package)
+            if old and old.filename == pyfile.filename and self.stats[package] == stats[package]:
+                files[package] = old
+            else:
+                changed.add(package)
+
+        if set(files) != set(self.files):
+            self.index = UsageIndex.load(files)
+        elif changed:
+            self.index.stat(files)
+        else:
+            return None
+        self.files, self.stats = files, stats
+        return changed
+
+    def wait(self):
+        if not INotify:
+            time.sleep(self.interval)
+            return
+        if self.inotify is None:
+            self.inotify = INotify()
+
+        mask = flags.MODIFY | flags.CREATE | flags.DELETE | flags.MOVED_TO | flags.MOVED_FROM
+        for root in self.roots:
+            if not os.path.isdir(root):
+                self.inotify.add_watch(os.path.dirname(root) or '.', mask)
+                continue
+            for dirname, dirs, _ in os.walk(root):
+                dirs[:] = [d for d in dirs if not d.startswith('.')]
+                self.inotify.add_watch(dirname, mask)
+
+        self.inotify.read()
+        # Editors write files in several steps, wait for these to settle
+        while self.inotify.read(timeout=100):
+            pass
+
+
+def _stat(filename):
+    try:
+        st = os.stat(filename)
+        return st.st_mtime, st.st_size
+    except OSError:
+        return None
@@ -18,7 +18,11 @@ setup(
         'astor>=0.6',
         'termcolor',
         'tqdm',
+        'futures; python_version < "3"',
     ],
+    extras_require={
+        'watch': ['inotify_simple'],
+    },
     entry_points = {
         'console_scripts': [
             'flaws = flaws:main',
@@ -0,0 +1,5 @@
+import sys
+
+
+# Language server tests use syntax of python 3.5+, so they are not even collected before that
+collect_ignore = ['test_server.py'] if sys.version_info < (3, 5) else []
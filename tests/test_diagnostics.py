@@ -0,0 +1,46 @@
+import json
+import sys
+
+import pytest
+
+from flaws.diagnostics import Diagnostic, text_sink, jsonl_sink, sarif_sink
+
+
+DIAGS = [
+    Diagnostic('pkg/a.py', 1, 4, 'unused-local', 'import os is never used'),
+    Diagnostic('pkg/a.py', 3, None, 'unused-global', 'function f is never used (globally)'),
+]
+
+
+def test_text(capsys):
+    text_sink(iter(DIAGS))
+    assert capsys.readouterr().out.splitlines() == [
+        'pkg/a.py:1:4: import os is never used',
+        'pkg/a.py:3: function f is never used (globally)',
+    ]
+
+
+def test_jsonl(capsys):
+    jsonl_sink(iter(DIAGS))
+    lines = capsys.readouterr().out.splitlines()
+    assert [Diagnostic(**json.loads(line)) for line in lines] == DIAGS
+
+
+def test_sarif(capsys):
+    sarif_sink(iter(DIAGS))
+    results = json.loads(capsys.readouterr().out)['runs'][0]['results']
+    assert [r['ruleId'] for r in results] == ['unused-local', 'unused-global']
+    assert results[0]['locations'][0]['physicalLocation']['region'] \
+        == {'startLine': 1, 'startColumn': 5}
+
+    sarif_sink(iter([]))
+    assert json.loads(capsys.readouterr().out)['runs'][0]['results'] == []
+
+
+def test_unknown_format(monkeypatch):
+    import flaws
+
+    monkeypatch.setattr(sys, 'argv', ['flaws', 'local', 'a.py', '--format=xml'])
+    with pytest.raises(SystemExit) as e:
+        flaws.main()
+    assert str(e.value) == 'Unknown format xml, choose from jsonl, sarif, text'
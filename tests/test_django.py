@@ -0,0 +1,27 @@
+from collections import defaultdict
+
+from flaws.analysis import FileSet
+from flaws.ext.django import global_usage
+
+from .test_global import _package
+
+
+def test_default_app_config(tmpdir):
+    _package(tmpdir, {
+        '__init__.py': '',
+        'app/__init__.py': 'default_app_config = "pkg.app.apps.Config"',
+        'app/apps.py': 'class Config(object):\n    pass',
+        # Not a literal, can't follow it, but shouldn't stop other marks
+        'other/__init__.py': 'default_app_config = get_config()',
+        'management/commands/run.py': 'class Command(object):\n    pass',
+    })
+    with tmpdir.as_cwd():
+        files = FileSet(['pkg'])
+        files.summarize()
+        used = defaultdict(set)
+        global_usage(files, used)
+
+    assert used['pkg.app'] == {'default_app_config'}
+    assert used['pkg.app.apps'] == {'Config'}
+    assert used['pkg.other'] == {'default_app_config'}
+    assert used['pkg.management.commands.run'] == {'Command'}
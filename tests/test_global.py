@@ -0,0 +1,263 @@
+import gc
+import textwrap
+import weakref
+
+import pytest
+
+from flaws.analysis import FileSet, global_usage, names_mask
+from flaws.diagnostics import text_sink
+from flaws.utils import BulkGC, atomic_write
+
+
+def test_unused(tmpdir, capsys):
+    _package(tmpdir, {
+        '__init__.py': '',
+        'a.py': '''
+            def f():
+                pass
+
+            def g():
+                pass
+        ''',
+        'b.py': '''
+            from .a import f
+
+            f()
+        ''',
+    })
+    assert _global(tmpdir, capsys) == ['pkg/a.py:5: function g is never used (globally)']
+
+
+def test_module_attr(tmpdir, capsys):
+    _package(tmpdir, {
+        '__init__.py': '',
+        'a.py': '''
+            def f():
+                pass
+
+            def g():
+                pass
+        ''',
+        'b.py': '''
+            from pkg import a
+
+            a.g()
+        ''',
+    })
+    assert _global(tmpdir, capsys) == ['pkg/a.py:2: function f is never used (globally)']
+
+
+def test_module_chains(tmpdir, capsys):
+    _package(tmpdir, {
+        '__init__.py': '',
+        'sub/__init__.py': '',
+        'sub/a.py': '''
+            def f():
+                pass
+
+            def g():
+                pass
+
+            def h():
+                pass
+
+            def k():
+                pass
+        ''',
+        'b.py': '''
+            import pkg.sub.a
+            from pkg import sub
+            import pkg.sub as s
+
+            pkg.sub.a.f()
+            sub.a.g()
+            s.a.h()
+        ''',
+    })
+    assert _global(tmpdir, capsys) == ['pkg/sub/a.py:11: function k is never used (globally)']
+
+
+def test_star(tmpdir, capsys):
+    _package(tmpdir, {
+        '__init__.py': '',
+        'a.py': '''
+            __all__ = ['f', 'g']
+
+            def f():
+                pass
+
+            def g():
+                pass
+        ''',
+        'b.py': '''
+            from .a import *
+
+            def h():
+                return f()
+            h()
+        ''',
+    })
+    assert _global(tmpdir, capsys) == ['pkg/a.py:7: function g is never used (globally)']
+
+
+def test_syntax_error(tmpdir, capsys):
+    _package(tmpdir, {
+        '__init__.py': '',
+        'a.py': 'def f():\n    pass',
+        'b.py': 'from .a import f\nf(',
+    })
+    # Exact message and column depend on python version
+    error, unused = _global(tmpdir, capsys)
+    assert error.startswith('pkg/b.py:2:')
+    assert unused == 'pkg/a.py:1: function f is never used (globally)'
+
+
+def test_jobs(tmpdir, capsys):
+    sources = {
+        '__init__.py': 'from .a import f\n__all__ = ["f"]',
+        'a.py': 'import os\ndef f():\n    return os.path\ndef g():\n    pass',
+    }
+    _package(tmpdir, sources)
+    serial = _global(tmpdir, capsys)
+    assert serial == ['pkg/a.py:4: function g is never used (globally)']
+    assert _global(tmpdir, capsys, jobs=2) == serial
+
+
+def test_cache(tmpdir, capsys):
+    _package(tmpdir, {
+        '__init__.py': '',
+        'a.py': 'def f():\n    pass',
+    })
+    with tmpdir.as_cwd():
+        files = FileSet(['pkg'], cache_dir='cache')
+        text_sink(global_usage(files))
+        assert 'tree' in files['pkg.a'].__dict__
+
+        files = FileSet(['pkg'], cache_dir='cache')
+        text_sink(global_usage(files))
+        assert 'tree' not in files['pkg.a'].__dict__
+
+    assert capsys.readouterr().out.splitlines() == \
+        ['pkg/a.py:1: function f is never used (globally)'] * 2
+
+
+def test_cache_unwritable(tmpdir, capsys):
+    _package(tmpdir, {'__init__.py': '', 'a.py': 'def f():\n    pass'})
+    # A file where cache dir should be
+    tmpdir.join('cache').write('')
+    with tmpdir.as_cwd():
+        text_sink(global_usage(FileSet(['pkg'], cache_dir='cache/sub')))
+
+    out, err = capsys.readouterr()
+    assert out.splitlines() == ['pkg/a.py:1: function f is never used (globally)']
+    assert err.count('WARNING: failed writing cache') == 1
+
+
+def test_incremental(tmpdir, capsys):
+    _package(tmpdir, {
+        '__init__.py': '',
+        'a.py': 'def f():\n    pass\ndef g():\n    pass',
+        'b.py': 'from .a import f',
+        'c.py': 'def h():\n    pass',
+    })
+    with tmpdir.as_cwd():
+        text_sink(global_usage(FileSet(['pkg'], cache_dir='cache')))
+        tmpdir.join('pkg', 'b.py').write('from .a import f, g')
+        text_sink(global_usage(FileSet(['pkg'], cache_dir='cache')))
+
+    assert capsys.readouterr().out.splitlines() == [
+        'pkg/a.py:3: function g is never used (globally)',
+        'pkg/b.py:1: import f is never used (globally)',
+        'pkg/c.py:1: function h is never used (globally)',
+        'pkg/b.py:1: import f is never used (globally)',
+        'pkg/b.py:1: import g is never used (globally)',
+        'pkg/c.py:1: function h is never used (globally)',
+    ]
+
+
+def test_cache_filenames(tmpdir, capsys):
+    _package(tmpdir, {'__init__.py': '', 'a.py': 'def f():\n    pass'})
+    with tmpdir.as_cwd():
+        text_sink(global_usage(FileSet(['pkg'], cache_dir='cache')))
+        text_sink(global_usage(FileSet(['./pkg'], cache_dir='cache')))
+
+    assert capsys.readouterr().out.splitlines() == [
+        'pkg/a.py:1: function f is never used (globally)',
+        './pkg/a.py:1: function f is never used (globally)',
+    ]
+
+
+def test_low_memory(tmpdir, capsys):
+    _package(tmpdir, {
+        '__init__.py': '',
+        'a.py': 'def f():\n    pass',
+    })
+    with tmpdir.as_cwd():
+        files = FileSet(['pkg'], low_memory=True)
+        text_sink(global_usage(files))
+        assert 'tree' not in files['pkg.a'].__dict__
+
+    assert capsys.readouterr().out.splitlines() == \
+        ['pkg/a.py:1: function f is never used (globally)']
+
+
+def test_names_mask():
+    ids = {}
+    assert names_mask(ids, ['a', 'b']) == 0b11
+    # Many names go another way
+    many = ['n%d' % i for i in range(100)] + ['b']
+    assert names_mask(ids, many) == (1 << 102) - 2
+    assert names_mask(ids, ['a']) == 1
+    assert len(ids) == 102
+
+
+def test_many_names(tmpdir, capsys):
+    _package(tmpdir, {
+        '__init__.py': '',
+        'a.py': ''.join('def f%d():\n    pass\n\n' % i for i in range(70)),
+        'b.py': ''.join('from .a import f%d\nf%d()\n' % (i, i) for i in range(69)),
+    })
+    assert _global(tmpdir, capsys) == ['pkg/a.py:208: function f69 is never used (globally)']
+
+
+def test_atomic_write(tmpdir):
+    path = str(tmpdir.join('out'))
+    atomic_write(path, b'data')
+    assert tmpdir.join('out').read() == 'data'
+
+    def fail(filename):
+        raise ValueError('oops')
+    with pytest.raises(ValueError):
+        atomic_write(path, fail)
+    # Old file is intact, temporary one is removed
+    assert tmpdir.listdir() == [tmpdir.join('out')]
+    assert tmpdir.join('out').read() == 'data'
+
+
+def test_bulk_gc():
+    class Node(object):
+        pass
+
+    with BulkGC(threshold=0) as bulk:
+        assert not gc.isenabled()
+        node = Node()
+        node.up = node
+        ref = weakref.ref(node)
+        del node
+        bulk.step()
+        assert ref() is None
+    assert gc.isenabled()
+
+
+# Testing utilities
+
+def _package(tmpdir, sources):
+    pkg = tmpdir.join('pkg')
+    pkg.ensure(dir=True)
+    for filename, source in sources.items():
+        pkg.join(filename).write(textwrap.dedent(source), ensure=True)
+
+def _global(tmpdir, capsys, jobs=None):
+    with tmpdir.as_cwd():
+        text_sink(global_usage(FileSet(['pkg']), jobs=jobs))
+    return capsys.readouterr().out.splitlines()
@@ -0,0 +1,27 @@
+import os
+import subprocess
+import sys
+
+
+# Not needed for local analysis of a couple of files, e.g. in a pre-commit hook
+HEAVY = ['astor', 'termcolor', 'tqdm', 'multiprocessing', 'concurrent.futures',
+         'flaws.ext.django', 'sqlite3', 'asyncio']
+
+SCRIPT = """
+import sys
+sys.argv = ['flaws', 'local', 'a.py', '--no-cache']
+import flaws
+flaws.main()
+print(' '.join(name for name in %r if name in sys.modules))
+"""
+
+
+def test_lazy_imports(tmpdir):
+    tmpdir.join('a.py').write('import os\n')
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    paths = [root, os.environ.get('PYTHONPATH')]
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, paths)))
+
+    with tmpdir.as_cwd():
+        output = subprocess.check_output([sys.executable, '-c', SCRIPT % HEAVY], env=env)
+    assert output.decode().splitlines() == ['a.py:1:0: import os is never used', '']
@@ -0,0 +1,95 @@
+import os
+
+from flaws.analysis import FileSet, map_files, local_usage, global_usage
+from flaws.ext import GLOBAL_USAGE
+from flaws.scopes import build_scopes
+
+from .test_global import _package, _global
+
+
+def test_analysis_error(tmpdir, monkeypatch):
+    _package(tmpdir, {'__init__.py': '', 'a.py': 'import os', 'b.py': 'import sys'})
+
+    def broken_scope(tree):
+        if tree.body:
+            raise ValueError('broken')
+        from flaws.scopes import ScopeBuilder
+        ScopeBuilder().visit(tree)
+        tree.scope.freeze()
+    monkeypatch.setattr('flaws.analysis.build_scopes', broken_scope)
+
+    with tmpdir.as_cwd():
+        lines = [str(diag) for diag in local_usage(FileSet(['pkg']))]
+    assert lines == [
+        'pkg/a.py:1: analysis failed with ValueError: broken',
+        'pkg/b.py:1: analysis failed with ValueError: broken',
+    ]
+
+
+def test_failure_not_cached(tmpdir, monkeypatch):
+    _package(tmpdir, {'__init__.py': '', 'a.py': 'def f():\n    pass'})
+
+    def no_memory(tree):
+        if tree.body:
+            raise MemoryError()
+        build_scopes(tree)
+    with monkeypatch.context() as m:
+        m.setattr('flaws.analysis.build_scopes', no_memory)
+        with tmpdir.as_cwd():
+            FileSet(['pkg'], cache_dir='cache').summarize()
+
+    # Once the cause is gone the file is analyzed again
+    with tmpdir.as_cwd():
+        files = FileSet(['pkg'], cache_dir='cache')
+        files.summarize()
+    assert files['pkg.a'].summary.errors == ()
+    assert 'f' in files['pkg.a'].summary.names
+
+
+def test_broken_symlink(tmpdir, capsys):
+    _package(tmpdir, {'__init__.py': '', 'a.py': 'import os'})
+    tmpdir.join('pkg', 'b.py').mksymlinkto(tmpdir.join('missing.py'))
+
+    with tmpdir.as_cwd():
+        for _ in range(2):
+            lines = sorted(str(diag) for diag in global_usage(FileSet(['pkg'], cache_dir='cache')))
+            assert len(lines) == 2
+            assert lines[0] == 'pkg/a.py:1: import os is never used (globally)'
+            assert lines[1].startswith('pkg/b.py:1: analysis failed with ')
+
+
+def test_plugin_error(tmpdir, capsys):
+    _package(tmpdir, {'__init__.py': '', 'a.py': 'def f():\n    pass'})
+
+    def plugin(files, used):
+        used['pkg.a'].add('f')
+        raise AssertionError('oops')
+    plugin.__module__ = 'flaws.ext.broken'
+
+    GLOBAL_USAGE.append(plugin)
+    try:
+        assert _global(tmpdir, capsys) == \
+            ['<plugin broken>:1: plugin failed with AssertionError: oops']
+    finally:
+        GLOBAL_USAGE.remove(plugin)
+
+
+def crash(pyfile):
+    if pyfile.package == 'pkg.b' and not pyfile.failure:
+        os._exit(1)
+    return [message for _, _, _, message in pyfile.errors]
+
+
+def test_worker_crash(tmpdir):
+    _package(tmpdir, {name: '' for name in ['__init__.py', 'a.py', 'b.py', 'c.py', 'd.py']})
+
+    with tmpdir.as_cwd():
+        files = FileSet(['pkg'])
+        results = list(map_files(crash, files.values(), jobs=2))
+    assert results == [
+        ('pkg', []),
+        ('pkg.a', []),
+        ('pkg.b', ['worker process crashed analyzing this file']),
+        ('pkg.c', []),
+        ('pkg.d', []),
+    ]
@@ -0,0 +1,24 @@
+from flaws.analysis import FileSet, local_usage
+
+
+def test_coding_cookie(tmpdir):
+    pkg = tmpdir.join('pkg')
+    pkg.join('__init__.py').write('', ensure=True)
+    pkg.join('a.py').write_binary(u'# -*- coding: latin-1 -*-\ndef f():\n    x = "\xe9"\n'
+                                  .encode('latin-1'))
+    assert _local(tmpdir) == ['pkg/a.py:3:4: variable x is never used']
+
+
+def test_syntax_error(tmpdir):
+    pkg = tmpdir.join('pkg')
+    pkg.join('__init__.py').write('', ensure=True)
+    pkg.join('a.py').write('def f(:\n    pass\n')
+    pkg.join('b.py').write('def f():\n    x = 1\n')
+    error, unused = _local(tmpdir)
+    assert error.startswith('pkg/a.py:1:')
+    assert unused == 'pkg/b.py:2:4: variable x is never used'
+
+
+def _local(tmpdir):
+    with tmpdir.as_cwd():
+        return [str(diag) for diag in local_usage(FileSet(['pkg']))]
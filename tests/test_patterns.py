@@ -1,4 +1,5 @@
 import ast
+import textwrap
 
 from flaws.asttools import get_body_ast
 from flaws.patterns import compile_template, match
@@ -147,3 +148,62 @@ def test_subexpr():
     import astor
 
     assert match(expr, tree) == [tree[0].value]
+
+
+# Several templates at once
+
+@compile_template
+def plus_one():
+    x + 1
+
+
+def test_matcher():
+    from flaws.patterns import Matcher
+
+    @get_body_ast
+    def tree():
+        while cond:
+            a = 1
+            b = a
+        if x < 12:
+            return True
+        else:
+            return False
+
+    matches = Matcher({'if': useless_if, 'assign': assignments}).match(tree)
+    assert [(name, node) for name, node, _ in matches] == \
+        [('assign', tree[0].body[0]), ('if', tree[1])]
+    assert list(matches[1][2]) == ['cond']
+
+
+def test_matcher_index():
+    from flaws.patterns import Matcher
+    from flaws.scopes import TreeLinker
+
+    tree = ast.parse(textwrap.dedent("""
+        def f(x):
+            if x < 12:
+                return True
+            else:
+                return False
+        y = x + 1
+    """))
+    TreeLinker().visit(tree)
+
+    matcher = Matcher({'if': useless_if, 'expr': plus_one})
+    assert matcher.match(tree, tree.index) == matcher.match(tree)
+    assert [(name, node.lineno) for name, node, _ in matcher.match(tree, tree.index)] == \
+        [('if', 3), ('expr', 7)]
+
+
+def test_matcher_long():
+    from flaws.patterns import Matcher
+    from flaws.scopes import TreeLinker
+
+    tree = ast.parse(''.join('a%d = 1\ny = x + 1\n' % i for i in range(2000)))
+    TreeLinker().visit(tree)
+
+    matcher = Matcher({'assign': assignments, 'expr': plus_one})
+    matches = matcher.match(tree, tree.index)
+    assert len(matches) == 2000
+    assert matches == matcher.match(tree)
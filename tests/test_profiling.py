@@ -0,0 +1,48 @@
+import sys
+
+from flaws.profiling import Profiler
+
+from .test_global import _package
+
+
+def test_nested():
+    profiler = Profiler()
+    with profiler.phase('parse'):
+        pass
+    assert not profiler.phases
+
+    profiler.enable()
+    for filename in ['a.py', 'b.py']:
+        with profiler.phase('scopes', filename):
+            with profiler.phase('resolve'):
+                sum(range(10000))
+    with profiler.phase('global'):
+        pass
+
+    assert {name: stats[0] for name, stats in profiler.phases.items()} == \
+        {'scopes': 2, 'resolve': 2, 'global': 1}
+    assert set(profiler.files) == {'a.py', 'b.py'}
+    # Nested phase time goes to the file too
+    walls = profiler.phases['scopes'][1] + profiler.phases['resolve'][1]
+    assert abs(sum(profiler.files.values()) - walls) < 1e-9
+
+
+def test_output_share(tmpdir, monkeypatch, capsys):
+    import flaws
+    from flaws.profiling import profiler
+
+    _package(tmpdir, {'__init__.py': ''})
+    for i in range(3):
+        tmpdir.join('pkg', 'm%d.py' % i).write('import os\n')
+    monkeypatch.setattr(sys, 'argv', ['flaws', 'global', 'pkg', '--no-cache', '--plugins=',
+                                      '--jobs=2', '--profile'])
+    monkeypatch.setattr(profiler, 'enabled', False)
+    monkeypatch.setattr(profiler, 'phases', Profiler().phases)
+    monkeypatch.setattr(profiler, 'files', Profiler().files)
+    with tmpdir.as_cwd():
+        flaws.main()
+
+    # Analysis, including waiting for workers, is not accounted to output
+    calls = {name: stats[0] for name, stats in profiler.phases.items()}
+    assert all(calls[name] == 1 for name in ['analysis', 'summarize', 'global', 'output'])
+    assert all(wall >= 0 and cpu >= 0 for _, wall, cpu, _ in profiler.phases.values())
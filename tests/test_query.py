@@ -0,0 +1,71 @@
+import sys
+
+from flaws.analysis import FileSet
+
+from .test_global import _package
+
+
+def test_find_uses(tmpdir):
+    _package(tmpdir, {
+        '__init__.py': 'from .a import f\n',
+        'a.py': '''
+            def f():
+                pass
+
+            def g():
+                return f()
+        ''',
+        'b.py': '''
+            from .a import f as h
+            from . import a
+            import pkg.a
+
+            h()
+            a.f()
+            pkg.a.f()
+            a.g()
+        ''',
+        'c.py': '''
+            from pkg import f
+
+            def k():
+                return f
+        ''',
+        'd.py': '''
+            from .a import *
+
+            f()
+        ''',
+        'e.py': 'def other():\n    pass',
+    })
+    with tmpdir.as_cwd():
+        files = FileSet(['pkg'])
+        uses = [(module, node.lineno) for module, node in files.find_uses('pkg.a', 'f')]
+        assert uses == [('pkg.a', 6), ('pkg.b', 6), ('pkg.b', 7), ('pkg.b', 8),
+                        ('pkg.c', 5), ('pkg.d', 4)]
+        # Files not mentioning f are not even parsed
+        assert 'tree' not in files['pkg.e'].__dict__
+
+
+def test_scope_of(tmpdir):
+    _package(tmpdir, {
+        '__init__.py': '',
+        'a.py': 'def f():\n    pass',
+        'b.py': 'x = 1',
+    })
+    with tmpdir.as_cwd():
+        files = FileSet(['pkg'])
+        assert list(files.scope_of('pkg.a').names) == ['f']
+        assert 'scope' not in files['pkg.b'].__dict__
+
+
+def test_unknown_module(tmpdir, monkeypatch, capsys):
+    import flaws
+
+    _package(tmpdir, {'__init__.py': ''})
+    with tmpdir.as_cwd():
+        for args in [['scope', 'pkg', '--module=pkg.a'], ['uses', 'pkg', '--ref=other.f']]:
+            monkeypatch.setattr(sys, 'argv', ['flaws'] + args + ['--no-cache'])
+            flaws.main()
+    assert capsys.readouterr().out.splitlines() == ['Unknown module pkg.a',
+                                                    'Unknown module in other.f']
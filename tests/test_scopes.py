@@ -1,8 +1,12 @@
 import ast
+import os
+import sys
 import textwrap
 
+import pytest
+
 from flaws.asttools import get_body_ast
-from flaws.scopes import fill_scopes
+from flaws.scopes import fill_scopes, TreeLinker, ScopeBuilder
 
 
 def test_refer():
@@ -110,6 +114,236 @@ def test_except():
     assert len(tree.scope.names['e']) == 2
 
 
+def test_index():
+    tree = ast.parse('f(1)\nx.f(2)\ng(f)')
+    TreeLinker().visit(tree)
+
+    assert [n.lineno for n in tree.index.calls['f']] == [1, 2]
+    assert len(tree.index.types[ast.Call]) == 3
+    assert {n.id for n in tree.index.nodes(ast.Name)} == {'f', 'x', 'g'}
+
+
+def test_parent():
+    tree = ast.parse('x = a.b.c')
+    TreeLinker().visit(tree)
+    index, assign = tree.index, tree.body[0]
+    name = assign.value.value.value
+
+    assert index.parent(tree) is None
+    assert index.parent(assign) is tree
+    assert index.parent(name) is assign.value.value
+    assert index.parent(name, ast.Assign) is None
+    assert index.parent(assign.value, ast.Assign) is assign
+    # Nodes are not linked to their parents
+    assert 'up' not in name.__dict__
+
+
+def test_bare_except():
+    @_debug_scope
+    def tree():
+        try:
+            pass
+        except:
+            pass
+
+    assert _dump(tree.scope) == {}
+
+
+@pytest.mark.skipif(sys.version_info < (3,), reason='python 3 only')
+def test_comprehension():
+    tree = _source_scope('''
+        def f(xs):
+            return [x for x in xs if x]
+    ''')
+    assert _dump(tree.scope) == {
+        'names': ['f'],
+        'children': [{
+            'name': 'FunctionDef f',
+            'names': ['xs'],
+            'children': [{'name': 'ListComp', 'names': ['x']}]
+        }]
+    }
+
+
+def test_comprehension_in_class():
+    tree = _source_scope('''
+        class A:
+            xs = [1, 2]
+            ys = [x for x in xs]
+    ''')
+    class_scope, = tree.scope.children
+    comp_scope, = class_scope.children
+    # The first iterable is evaluated in class scope, so xs refers there
+    assert len(class_scope.names['xs']) == 2
+    assert list(comp_scope.names) == ['x']
+
+
+@pytest.mark.skipif(sys.version_info < (3, 8), reason='walrus is python 3.8+')
+def test_walrus():
+    tree = _source_scope('''
+        def f(xs):
+            if any((y := x) for x in xs):
+                return y
+    ''')
+    func_scope, = tree.scope.children
+    assert sorted(func_scope.names) == ['xs', 'y']
+    assert len(func_scope.names['y']) == 2
+
+
+@pytest.mark.skipif(sys.version_info < (3,), reason='python 3 only')
+def test_nonlocal():
+    tree = _source_scope('''
+        def f():
+            x = 1
+            def g():
+                nonlocal x
+                x = 2
+            return g
+    ''')
+    f_scope, = tree.scope.children
+    g_scope, = f_scope.children
+    assert len(f_scope.names['x']) == 2
+    assert 'x' not in g_scope.names
+
+
+@pytest.mark.skipif(sys.version_info < (3, 5), reason='async is python 3.5+')
+def test_async_and_annotations():
+    tree = _source_scope('''
+        T = int
+        async def f(x: T, *, y: T = None) -> T:
+            return x
+    ''')
+    assert len(tree.scope.names['T']) == 4
+    func_scope, = tree.scope.children
+    assert func_scope.node.name == 'f'
+    assert sorted(func_scope.names) == ['x', 'y']
+
+
+@pytest.mark.skipif(sys.version_info < (3, 10), reason='match is python 3.10+')
+def test_match():
+    tree = _source_scope('''
+        match command:
+            case [x, *rest]:
+                pass
+            case {'a': 1, **kw}:
+                pass
+            case str() as s:
+                pass
+    ''')
+    assert sorted(tree.scope.names) == ['command', 'kw', 'rest', 's', 'str', 'x']
+
+
+def test_deep_expression():
+    # Deeper than default recursion limit
+    tree = _source_scope('x = ' + ' + '.join(['y'] * 1500))
+    assert len(tree.scope.names['y']) == 1500
+    assert len(tree.index.types[ast.BinOp]) == 1499
+
+
+def test_walk_order():
+    tree = _source_scope('''
+        def f():
+            def g():
+                pass
+        def h():
+            pass
+    ''')
+    assert [s.node.name for s in tree.scope.walk_scopes() if not s.is_module] == ['f', 'g', 'h']
+    assert [name for _, name, _ in tree.scope.walk()] == ['f', 'h', 'g']
+
+
+# Resolution is checked against a straightforward one rescanning subtree on each scope exit
+
+EQUIVALENCE_SOURCES = [
+    '''
+        from os.path import *
+        x = 1
+        def f(a):
+            global y
+            y = a
+            class A:
+                z = x
+                x = 2
+                def m(self):
+                    return x, z, join
+            def g():
+                a = [b for b in x if b]
+                return lambda c: c + a + undefined
+            return A, g
+    ''',
+    '''
+        def f():
+            from foo import *
+            def g():
+                def h():
+                    return bar, len, f
+                return h
+            return g
+    ''',
+]
+
+
+def test_resolve_equivalence():
+    import json, email
+    sources = [textwrap.dedent(source) for source in EQUIVALENCE_SOURCES]
+    for module in [json, email]:
+        dirname = os.path.dirname(module.__file__)
+        for filename in sorted(os.listdir(dirname)):
+            if filename.endswith('.py'):
+                with open(os.path.join(dirname, filename), 'rb') as f:
+                    sources.append(f.read())
+
+    for source in sources:
+        _check_equivalence(source)
+
+
+@pytest.mark.skipif(sys.version_info < (3,), reason='python 3 only')
+def test_resolve_equivalence_nonlocal():
+    _check_equivalence(textwrap.dedent('''
+        def f(a):
+            def g():
+                nonlocal a
+                a = [b for b in a if b]
+                return lambda c: c + a + undefined
+            return g
+    '''))
+
+
+def _check_equivalence(source):
+    tree, reference = ast.parse(source), ast.parse(source)
+    TreeLinker().visit(tree)
+    TreeLinker().visit(reference)
+    ScopeBuilder().visit(tree)
+    _ReferenceBuilder().visit(reference)
+    assert _scope_state(tree.scope) == _scope_state(reference.scope)
+
+
+class _ReferenceBuilder(ScopeBuilder):
+    def pop_scope(self):
+        scope = self.scope
+        self.pending.pop()
+        scope.resolve({})
+        if not scope.is_class:
+            for from_scope in list(scope.walk_scopes())[1:]:
+                for name, nodes in list(from_scope.unscoped_names.items()):
+                    if scope.has_stars:
+                        scope.maybe_from_star[name] = nodes
+                    if name in scope.names or scope.is_global(name):
+                        scope.names[name].extend(nodes)
+                        from_scope.unscoped_names.pop(name)
+                    elif scope.is_module:
+                        from_scope.names[name].extend(nodes)
+                        from_scope.unscoped_names.pop(name)
+        self.scopes.pop()
+
+def _scope_state(scope):
+    pos = lambda nodes: [(type(n).__name__, getattr(n, 'lineno', None)) for n in nodes]
+    return [(sorted((name, pos(nodes)) for name, nodes in s.names.items()),
+             sorted((name, pos(nodes)) for name, nodes in s.maybe_from_star.items()),
+             dict(s.unscoped_names))
+            for s in scope.walk_scopes()]
+
+
 # Testing utilities
 
 def _debug_scope(func):
@@ -121,6 +355,12 @@ def _debug_scope(func):
     print(tree.scope)
     return tree
 
+def _source_scope(source):
+    tree = ast.parse(textwrap.dedent(source))
+    fill_scopes(tree)
+    print(tree.scope)
+    return tree
+
 def _dump(scope):
     res = {}
 
@@ -134,5 +374,3 @@ def _dump(scope):
         res['children'] = [_dump(c) for c in scope.children]
 
     return res
-
-
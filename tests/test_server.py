@@ -0,0 +1,125 @@
+import io
+import json
+
+from funcy import partial
+
+from flaws.analysis import FileSet
+
+from .test_global import _package
+
+
+def test_diagnostics(tmpdir):
+    _package(tmpdir, {
+        '__init__.py': '',
+        'a.py': 'def f():\n    pass',
+        'b.py': 'from .a import f\nf()',
+    })
+    uri = 'file://' + str(tmpdir.join('pkg', 'b.py'))
+    with tmpdir.as_cwd():
+        messages = _serve([
+            {'id': 1, 'method': 'initialize', 'params': {}},
+            {'method': 'initialized', 'params': {}},
+        ], [
+            # Unsaved buffer stops using f
+            {'method': 'textDocument/didOpen',
+             'params': {'textDocument': {'uri': uri, 'text': 'import os\n'}}},
+        ], [
+            {'id': 2, 'method': 'unknown'},
+            {'id': 3, 'method': 'shutdown'},
+            {'method': 'exit'},
+        ])
+
+    assert messages[0]['result']['capabilities']['textDocumentSync']['change'] == 1
+    published = [(m['params']['uri'].rpartition('/')[2],
+                  [d['message'] for d in m['params']['diagnostics']])
+                 for m in messages if m.get('method') == 'textDocument/publishDiagnostics']
+    # Locals are published first, then files affected by global analysis
+    assert published == [
+        ('__init__.py', []), ('a.py', []), ('b.py', []),
+        ('__init__.py', []), ('a.py', []), ('b.py', []),
+        ('b.py', ['import os is never used']),
+        ('a.py', ['function f is never used (globally)']),
+        ('b.py', ['import os is never used', 'import os is never used (globally)']),
+    ]
+    assert messages[-2]['error']['code'] == -32601
+    assert messages[-1] == {'jsonrpc': '2.0', 'id': 3, 'result': None}
+
+
+def test_cancel_stale(tmpdir):
+    _package(tmpdir, {'__init__.py': ''})
+    uri = 'file://' + str(tmpdir.join('pkg', '__init__.py'))
+    change = lambda text: {'method': 'textDocument/didChange', 'params': {
+        'textDocument': {'uri': uri}, 'contentChanges': [{'text': text}]}}
+    with tmpdir.as_cwd():
+        messages = _serve([
+            {'method': 'initialized', 'params': {}},
+            change('import os\n'),
+            change('import sys\n'),
+        ])
+
+    # Only the last version is analyzed, published once locally and once after global pass
+    assert [[d['message'] for d in m['params']['diagnostics']] for m in messages] == \
+        [['import sys is never used']] * 2
+
+
+def test_cancel_before_global(tmpdir, monkeypatch):
+    from flaws.server import Server
+
+    _package(tmpdir, {'__init__.py': 'import os\n'})
+    publish = Server.publish
+    cancelled = []
+
+    def cancelling_publish(self, package):
+        publish(self, package)
+        # An edit comes in after reload, but before global pass, leaving nothing to reload
+        if not cancelled:
+            cancelled.append(package)
+            self.schedule()
+    monkeypatch.setattr(Server, 'publish', cancelling_publish)
+
+    with tmpdir.as_cwd():
+        messages = _serve([{'method': 'initialized', 'params': {}}])
+
+    # Global pass is still redone and published
+    assert cancelled == ['pkg']
+    assert [[d['message'] for d in m['params']['diagnostics']] for m in messages] == \
+        [['import os is never used']] * 2
+
+
+def _serve(*batches):
+    """
+    Feeds batches of messages to a server, letting analysis finish after each one.
+    """
+    import asyncio
+    from flaws.server import Server
+
+    out = io.BytesIO()
+    server = Server(['pkg'], partial(FileSet, cache_dir='cache'), out=out, delay=0)
+
+    async def run():
+        reader = asyncio.StreamReader()
+        serving = asyncio.ensure_future(server.serve(reader))
+        for batch in batches:
+            for message in batch:
+                body = json.dumps(dict(message, jsonrpc='2.0')).encode('utf-8')
+                reader.feed_data(b'Content-Length: %d\r\n\r\n' % len(body) + body)
+            await asyncio.sleep(0.1)
+            if server.task:
+                await asyncio.wait([server.task])
+        reader.feed_eof()
+        await serving
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(run())
+    finally:
+        loop.close()
+
+    messages = []
+    data = out.getvalue()
+    while data:
+        header, _, data = data.partition(b'\r\n\r\n')
+        length = int(header.split(b':')[1])
+        messages.append(json.loads(data[:length].decode('utf-8')))
+        data = data[length:]
+    return messages
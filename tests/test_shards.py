@@ -0,0 +1,57 @@
+import sys
+
+import pytest
+
+from flaws.analysis import FileSet, global_usage
+from flaws.shards import parse_shard, select_shard, write_shard, load_shards
+
+
+SOURCES = {
+    '__init__.py': 'from .a import f\n__all__ = ["f"]',
+    'a.py': 'def f():\n    pass\n\ndef g():\n    pass\n\ndef h():\n    pass',
+    'b.py': 'from .a import g\nfrom .c import *\n\ndef m():\n    return k(g)',
+    'c.py': '__all__ = ["k"]\n\ndef k(x):\n    return x\n\ndef unused():\n    pass',
+}
+
+
+def test_merge(tmpdir):
+    for filename, source in SOURCES.items():
+        tmpdir.join('pkg', filename).write(source, ensure=True)
+
+    with tmpdir.as_cwd():
+        expected = list(global_usage(FileSet(['pkg'])))
+        for i in (1, 2, 3):
+            files = FileSet(['pkg'])
+            select_shard(files, i, 3)
+            write_shard(files, (i, 3), 'flaws-%d.shard' % i)
+        merged = load_shards(['flaws-%d.shard' % i for i in (1, 2, 3)])
+
+        assert sorted(merged) == ['pkg', 'pkg.a', 'pkg.b', 'pkg.c']
+        assert list(global_usage(merged)) == expected
+        assert [d.message for d in expected] == ['function h is never used (globally)',
+                                                 'function m is never used (globally)',
+                                                 'function unused is never used (globally)']
+
+        with pytest.raises(ValueError) as e:
+            load_shards(['flaws-1.shard', 'flaws-3.shard'])
+        assert 'Missing shards 2 out of 3' in str(e.value)
+
+
+def test_parse_shard():
+    assert parse_shard('2/4') == (2, 4)
+    for spec in ['0/4', '5/4', '1', 'a/b']:
+        with pytest.raises(ValueError):
+            parse_shard(spec)
+
+
+def test_cli_errors(tmpdir, monkeypatch):
+    import flaws
+
+    tmpdir.join('pkg', '__init__.py').write('', ensure=True)
+    with tmpdir.as_cwd():
+        for args, message in [(['global', 'pkg', '--shard=3/2'], 'should be from 1/2 to 2/2'),
+                              (['merge', 'flaws-1-of-2.shard'], 'flaws-1-of-2.shard')]:
+            monkeypatch.setattr(sys, 'argv', ['flaws'] + args + ['--no-cache'])
+            with pytest.raises(SystemExit) as e:
+                flaws.main()
+            assert message in str(e.value)
@@ -0,0 +1,31 @@
+import sqlite3
+
+from flaws.analysis import FileSet
+from flaws.symbols import write_symbols, SCHEMA_VERSION
+
+
+def test_write_symbols(tmpdir):
+    pkg = tmpdir.join('pkg')
+    pkg.join('__init__.py').write('from .a import f\n__all__ = ["f"]', ensure=True)
+    pkg.join('a.py').write('def f(x):\n    return g(x)\n\ndef g(y):\n    pass')
+    pkg.join('b.py').write('from pkg import a\na.g(1)')
+
+    with tmpdir.as_cwd():
+        write_symbols(FileSet(['pkg']), 'flaws.db')
+    db = sqlite3.connect(str(tmpdir.join('flaws.db')))
+
+    assert db.execute('PRAGMA user_version').fetchone() == (SCHEMA_VERSION,)
+    assert db.execute("SELECT user FROM module_uses WHERE module = 'pkg.a' AND name = 'g'"
+                      " ORDER BY user").fetchall() == [('pkg.b',)]
+    assert db.execute("SELECT e.name FROM exports e JOIN modules m ON m.id = e.module_id"
+                      " WHERE m.name = 'pkg'").fetchall() == [('f',)]
+    assert db.execute("SELECT imported, name FROM imports ORDER BY module_id").fetchall() == \
+        [('pkg.a', 'f'), ('pkg', 'a')]
+
+    # Scopes, names and references
+    assert db.execute("SELECT s.kind, s.name, p.name FROM scopes s JOIN scopes p"
+                      " ON p.id = s.parent_id WHERE s.name = 'g'").fetchall() == \
+        [('function', 'g', None)]
+    assert db.execute("SELECT r.lineno, r.is_write FROM refs r JOIN names n ON n.id = r.name_id"
+                      " JOIN scopes s ON s.id = n.scope_id JOIN modules m ON m.id = s.module_id"
+                      " WHERE m.name = 'pkg.a' AND n.name = 'g'").fetchall() == [(4, 1), (2, 0)]
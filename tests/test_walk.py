@@ -0,0 +1,53 @@
+import subprocess
+
+import pytest
+
+from flaws.analysis import walk_files
+from flaws.ignore import Ignore
+
+
+def _tree(tmpdir, filenames):
+    for filename in filenames:
+        tmpdir.join(filename).ensure()
+
+
+def _walk(tmpdir, ignore=None):
+    with tmpdir.as_cwd():
+        return sorted(walk_files('pkg', ignore=ignore))
+
+
+def test_hidden(tmpdir):
+    _tree(tmpdir, ['pkg/.a/x.py', 'pkg/.b/x.py', 'pkg/c/x.py', 'pkg/d/x.py'])
+    assert _walk(tmpdir) == ['pkg/c/x.py', 'pkg/d/x.py']
+
+
+def test_exclude(tmpdir):
+    _tree(tmpdir, ['pkg/a.py', 'pkg/build/x.py', 'pkg/sub/build/x.py', 'pkg/sub/b.py',
+                   'pkg/sub/migrations/0001.py', 'pkg/tests/test_a.py', 'pkg/sub/tests.py'])
+    ignore = Ignore(patterns=['build', 'sub/migrations/', 'test*/', '!sub/b.py'])
+    assert _walk(tmpdir, ignore) == ['pkg/a.py', 'pkg/sub/b.py', 'pkg/sub/tests.py']
+
+    ignore = Ignore(patterns=['**/x.py', '/sub/*', '!/sub/b.py'])
+    assert _walk(tmpdir, ignore) == ['pkg/a.py', 'pkg/sub/b.py', 'pkg/tests/test_a.py']
+
+
+def test_ignore_regex(tmpdir):
+    _tree(tmpdir, ['pkg/a.py', 'pkg/migrations/0001.py', 'pkg/b_migrations.py'])
+    assert _walk(tmpdir, Ignore(r'migrations/')) == ['pkg/a.py', 'pkg/b_migrations.py']
+
+
+def test_gitignore(tmpdir):
+    _tree(tmpdir, ['pkg/a.py', 'pkg/gen/x.py', 'pkg/sub/b.py', 'pkg/sub/local.py'])
+    tmpdir.join('pkg', '.gitignore').write('gen/\n# comment\n')
+    tmpdir.join('pkg', 'sub', '.gitignore').write('local.py\n')
+
+    assert len(_walk(tmpdir)) == 4
+    expected = ['pkg/a.py', 'pkg/sub/b.py']
+    assert _walk(tmpdir, Ignore(gitignore=True)) == expected
+
+    # Same via git ls-files
+    try:
+        subprocess.check_call(['git', 'init', '-q', str(tmpdir)])
+    except (OSError, subprocess.CalledProcessError):
+        pytest.skip('git is not available')
+    assert _walk(tmpdir, Ignore(gitignore=True)) == expected
@@ -0,0 +1,36 @@
+import pytest
+from funcy import partial
+
+from flaws.analysis import FileSet
+from flaws.watch import Watcher
+
+
+@pytest.mark.parametrize('cache_dir', ['cache', None])
+def test_refresh(tmpdir, capsys, cache_dir):
+    pkg = tmpdir.join('pkg')
+    pkg.ensure(dir=True)
+    pkg.join('__init__.py').write('')
+    pkg.join('a.py').write('def f():\n    pass')
+    pkg.join('b.py').write('import os')
+
+    with tmpdir.as_cwd():
+        watcher = Watcher(['pkg'], partial(FileSet, ['pkg'], cache_dir=cache_dir))
+        watcher.refresh()
+        assert capsys.readouterr().out.splitlines() == [
+            'pkg/b.py:1:0: import os is never used',
+            'pkg/a.py:1: function f is never used (globally)',
+            'pkg/b.py:1: import os is never used (globally)',
+        ]
+        tree = watcher.files['pkg.b'].tree
+
+        # Nothing changed
+        watcher.refresh()
+        assert capsys.readouterr().out == ''
+
+        pkg.join('a.py').write('def f():\n    pass\ndef g():\n    pass')
+        watcher.refresh()
+        assert capsys.readouterr().out.splitlines() == [
+            'pkg/a.py:1: function f is never used (globally)',
+            'pkg/a.py:3: function g is never used (globally)',
+        ]
+        assert watcher.files['pkg.b'].tree is tree